@@ -9,9 +9,8 @@ import re
 import signal
 import sys
 import argparse
-import os
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
-from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
+from telegram.ext import AIORateLimiter, ApplicationBuilder, CommandHandler, MessageHandler, filters, ContextTypes, CallbackQueryHandler
 
 from config import TOKEN
 import database
@@ -42,6 +41,9 @@ telegram_ext_logger.setLevel(logging.INFO)
 # Global app instance
 app = None
 
+# Eerste URL in een bericht (tot de eerstvolgende witruimte)
+_URL_RE = re.compile(r"https://\S+")
+
 # URL and query handling
 async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Handle normal text messages from users."""
@@ -56,9 +58,10 @@ async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE
         return
 
     # Handle URLs
-    if "https://" in text:
+    url_match = _URL_RE.search(text)
+    if url_match:
         logger.debug("URL gedetecteerd in bericht")
-        await handle_url_input(update, context)
+        await handle_url_input(update, context, url_match.group(0))
         return
     
     # Log dat het bericht niet werd verwerkt
@@ -88,10 +91,9 @@ async def handle_query_name_input(update: Update, context: ContextTypes.DEFAULT_
     context.user_data["pending_query"] = None
     context.user_data["await_queryname"] = False
 
-async def handle_url_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    logger.info(f"Processing URL input: {update.message.text}")
-    text = update.message.text
-    context.user_data["pending_query"] = convert_lidl_url_to_api(text)
+async def handle_url_input(update: Update, context: ContextTypes.DEFAULT_TYPE, url: str):
+    logger.info(f"Processing URL input: {url}")
+    context.user_data["pending_query"] = convert_lidl_url_to_api(url)
     
     # Show inline Yes/No buttons
     keyboard = [
@@ -103,6 +105,7 @@ async def handle_url_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(
         text=f"URL gevonden:\n{context.user_data['pending_query']}\nWil je deze toevoegen?",
         reply_markup=InlineKeyboardMarkup(keyboard),
+        disable_web_page_preview=True,
     )
 
 async def confirm_query_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -122,35 +125,36 @@ async def cancel_query_callback(update: Update, context: ContextTypes.DEFAULT_TY
 
 def register_handlers(application):
     """Register all handlers with the application.""" 
-    logger.debug("Registreren van callback handlers...")
-    
-    application.add_handler(CallbackQueryHandler(choose_language, pattern="^lang_"))
-    application.add_handler(CallbackQueryHandler(confirm_query_callback, pattern="^confirm_query$"))
-    application.add_handler(CallbackQueryHandler(cancel_query_callback, pattern="^cancel_query$"))
-    application.add_handler(CallbackQueryHandler(delete_query_callback, pattern="^delete_"))
-    application.add_handler(CallbackQueryHandler(menu_callback_handler, pattern="^menu_"))
-    application.add_handler(CallbackQueryHandler(pause_query_callback, pattern="^pause_"))
-    application.add_handler(CallbackQueryHandler(resume_query_callback, pattern="^resume_"))
-
-
-    # Command handlers come next
-    logger.debug("Registreren van commando handlers...")
-    
-    application.add_handler(CommandHandler("start", start))
-    logger.debug("Handler voor /start geregistreerd")
+    # PTB controleert handlers in registratievolgorde; de vaakst gebruikte staan vooraan.
+    # Patronen en filters overlappen niet, dus de volgorde verandert niets aan de afhandeling.
     
-    application.add_handler(CommandHandler("menu", menu))
-    logger.debug("Handler voor /menu geregistreerd")
-    
-    application.add_handler(CommandHandler("list", list_queries))
-    application.add_handler(CommandHandler("pause", pause_query))
-    application.add_handler(CommandHandler("resume", resume_query))
-    application.add_handler(CommandHandler("delete", delete_query))
-
-    # Text handler for everything else
+    # Text handler for everything else (URLs en query namen)
     logger.debug("Registreren van text message handler...")
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text_message))
     
+    logger.debug("Registreren van callback handlers...")
+    for pattern, callback in (
+        ("^menu_", menu_callback_handler),
+        ("^confirm_query$", confirm_query_callback),
+        ("^cancel_query$", cancel_query_callback),
+        ("^pause_", pause_query_callback),
+        ("^resume_", resume_query_callback),
+        ("^delete_", delete_query_callback),
+        ("^lang_", choose_language),
+    ):
+        application.add_handler(CallbackQueryHandler(callback, pattern=pattern))
+
+    logger.debug("Registreren van commando handlers...")
+    for command, callback in (
+        ("menu", menu),
+        ("list", list_queries),
+        ("pause", pause_query),
+        ("resume", resume_query),
+        ("delete", delete_query),
+        ("start", start),
+    ):
+        application.add_handler(CommandHandler(command, callback))
+    
     logger.info("Alle handlers succesvol geregistreerd!")
 
 def main():
@@ -181,7 +185,25 @@ def main():
     # Initialize the global app variable
     global app
     logger.info(f"Bot initialiseren met token: {TOKEN[:5]}...{TOKEN[-5:] if len(TOKEN) > 10 else ''}")
-    app = ApplicationBuilder().token(TOKEN).build()
+    # Eén langlevende Bot met een eigen HTTPX connection pool: notificaties hergebruiken
+    # de keep-alive verbindingen naar api.telegram.org in plaats van steeds opnieuw te verbinden.
+    # De pool is ruim genoeg voor alle gelijktijdige notificaties plus gewone bot-antwoorden.
+    # De rate limiter houdt alle uitgaande berichten binnen de Telegram limieten
+    # (30 per seconde in totaal, 20 per minuut per groep); RetryAfter handelt notification.py af.
+    app = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .connection_pool_size(32)
+        .pool_timeout(5.0)
+        .rate_limiter(AIORateLimiter(
+            overall_max_rate=30,
+            overall_time_period=1,
+            group_max_rate=20,
+            group_time_period=60,
+            max_retries=0
+        ))
+        .build()
+    )
     
     # Register handlers
     register_handlers(app)
@@ -5,7 +5,7 @@ import time
 from contextlib import contextmanager
 import threading
 import random
-from queue import Queue, Empty
+from queue import Queue
 from typing import List, Dict, Any, Optional, Tuple
 from datetime import datetime
 import os
@@ -13,6 +13,9 @@ import os
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Maximaal aantal parameters per IN (...) lookup, ruim onder de SQLite limiet
+_MAX_IN_PARAMS = 500
+
 # Een geavanceerde connection pool implementatie
 class ConnectionPool:
     def __init__(self, db_path, max_connections=5, timeout=20):
@@ -22,6 +25,11 @@ class ConnectionPool:
         self.available_connections = []
         self.in_use_connections = set()
         self.lock = threading.RLock()  # Reentrant lock voor thread safety
+        
+        # Zorg eenmalig dat de map van de database bestaat, niet bij elke nieuwe verbinding
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
     
     def get_connection(self):
         """Get a connection from the pool or create a new one if needed."""
@@ -33,16 +41,18 @@ class ConnectionPool:
             
             if len(self.in_use_connections) < self.max_connections:
                 try:
-                    # Ensure directory exists
-                    db_dir = os.path.dirname(self.db_path)
-                    if db_dir and not os.path.exists(db_dir):
-                        os.makedirs(db_dir, exist_ok=True)
-                        
-                    conn = sqlite3.connect(self.db_path, timeout=self.timeout)
+                    # Grotere prepared-statement cache: de service gebruikt een vaste set queries.
+                    # De pool geeft een verbinding aan één gebruiker tegelijk, dus verbindingen
+                    # mogen veilig vanuit verschillende threads (worker threads, log thread) gebruikt worden.
+                    conn = sqlite3.connect(self.db_path, timeout=self.timeout, cached_statements=256,
+                                           check_same_thread=False)
                     # Configureer SQLite voor betere concurrency
                     conn.execute("PRAGMA busy_timeout = 30000")  # Verhoogd naar 30 seconden
                     conn.execute("PRAGMA journal_mode = WAL")  # Write-Ahead Logging mode
                     conn.execute("PRAGMA synchronous = NORMAL")  # Betere performance
+                    conn.execute("PRAGMA cache_size = -65536")  # 64 MiB page cache per verbinding
+                    conn.execute("PRAGMA temp_store = MEMORY")  # Tijdelijke tabellen en indexen in geheugen
+                    conn.execute("PRAGMA mmap_size = 268435456")  # Lees via memory-mapped I/O (256 MiB)
                     self.in_use_connections.add(conn)
                     return conn
                 except Error as e:
@@ -158,16 +168,15 @@ _log_db_path = None  # Moet expliciet worden ingesteld door init_db
 
 def log_worker(db_path):
     while True:
+        # Blokkeer tot er werk is; stop_log_thread stuurt None om de worker te beëindigen
+        log_entry = log_queue.get()
+        if log_entry is None:
+            break
         try:
-            log_entry = log_queue.get(timeout=1)
-            if log_entry is None:
-                break
             with get_connection_context(db_path) as conn:
                 cursor = conn.cursor()
                 cursor.execute(log_entry['query'], log_entry['params'])
                 conn.commit()
-        except Empty:
-            continue
         except Exception as e:
             logger.exception(f"Error in log worker: {e}")
 
@@ -389,6 +398,13 @@ def init_db(db_path):
         if 'discount_percentage' not in columns:
             cursor.execute('ALTER TABLE price_history ADD COLUMN discount_percentage FLOAT')
         
+        # Indexen voor de lookups die bij elke query run en notificatie gebeuren
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_query_code ON products (query_id, code)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_price_history_product_price ON price_history (product_id, new_price)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_query_executions_query_date ON query_executions (query_id, execution_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_notification_stats_execution_user ON notification_stats (query_execution_id, user_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_queries_user ON queries (user_id)')
+        
         logger.info(f"Database {db_path} initialized successfully.")
 
 def execute_query(db_path, query, params=(), max_retries=3):
@@ -436,56 +452,6 @@ def execute_select(db_path, query, params=(), max_retries=3):
     
     return []
 
-def log_notification_standalone(db_path, user_id, query_id, product_id, notification_type, old_price=None, new_price=None,
-                             discount_amount=None, discount_percentage=None, message_text=None, chat_id=None):
-    """
-    Zelfstandige functie om een notificatie te loggen in een aparte transactie.
-    Dit voorkomt blokkering van de hoofdtransactie als er een database lock optreedt.
-    """
-    max_retries = 15  # Zeer hoog aantal retries voor deze kritieke operatie
-    
-    for retry in range(max_retries):
-        try:
-            # Gebruik een geheel nieuwe database verbinding voor deze operatie
-            # Dit voorkomt lock contentie met andere connecties
-            conn = sqlite3.connect(db_path, timeout=30.0)
-            conn.execute("PRAGMA busy_timeout = 30000")  # 30 seconden timeout
-            
-            try:
-                cursor = conn.cursor()
-                cursor.execute('''
-                    INSERT INTO notifications 
-                    (user_id, query_id, product_id, notification_type, old_price, new_price, 
-                    discount_amount, discount_percentage, message_text, chat_id)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', (user_id, query_id, product_id, notification_type, old_price, new_price, 
-                    discount_amount, discount_percentage, message_text, chat_id))
-                
-                conn.commit()
-                result = cursor.lastrowid
-                conn.close()
-                return result
-            except Exception as inner_e:
-                conn.rollback()
-                conn.close()
-                raise inner_e
-                
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and retry < max_retries - 1:
-                # Nog agressievere backoff strategie
-                backoff = 0.5 * (2 ** retry) + (random.random() * 0.5)
-                logger.warning(f"Database locked in standalone notification logging, retry {retry+1}/{max_retries} in {backoff:.2f}s")
-                time.sleep(backoff)
-            else:
-                logger.error(f"Failed to log notification in standalone mode after {retry+1} attempts: {e}")
-                return None
-        except Exception as e:
-            logger.exception(f"Error in standalone notification logging: {e}")
-            return None
-    
-    logger.error("Maximum retries exceeded for standalone notification logging")
-    return None
-
 def update_notification_stats(conn, query_execution_id, user_id, query_id, new_product_count=0, 
                             price_drop_count=0, price_increase_count=0):
     """
@@ -519,37 +485,6 @@ def update_notification_stats(conn, query_execution_id, user_id, query_id, new_p
     
     return None
 
-def log_query_execution(conn, query_id, api_url, success, total_results=0, new_products=0, price_changes=0, 
-                      error_message=None, response_status=None, execution_time_ms=0):
-    """
-    Log een query uitvoering in de database met verbeterde error handling.
-    """
-    cursor = conn.cursor()
-    max_retries = 5
-    for retry in range(max_retries):
-        try:
-            cursor.execute('''
-                INSERT INTO query_executions 
-                (query_id, api_url, success, total_results, new_products, price_changes, 
-                 error_message, response_status, execution_time_ms)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (query_id, api_url, success, total_results, new_products, price_changes, 
-                 error_message, response_status, execution_time_ms))
-            return cursor.lastrowid
-        except sqlite3.OperationalError as e:
-            if "database is locked" in str(e) and retry < max_retries - 1:
-                backoff = 0.2 * (2 ** retry) + (random.random() * 0.2)
-                logger.warning(f"Database locked during log_query_execution, retrying in {backoff:.2f}s ({retry+1}/{max_retries})")
-                time.sleep(backoff)
-            else:
-                logger.error(f"Failed to log query execution after {retry+1} attempts: {e}")
-                raise
-        except Exception as e:
-            logger.exception(f"Error logging query execution: {e}")
-            raise
-    
-    return None
-
 # Nieuwe centraal database service class voor alle database operaties
 class DatabaseService:
     """
@@ -567,6 +502,11 @@ class DatabaseService:
             raise ValueError("Database path is required for DatabaseService")
         
         self.db_path = db_path
+        # Cache van query_id naar (user_id, chat_id); de eigenaar van een query verandert niet
+        self._query_user_cache: Dict[int, Tuple[int, str]] = {}
+        # Cache van chat_id naar de queries van die chat; wordt geleegd bij elke wijziging
+        self._chat_queries_cache: Dict[str, List[Tuple]] = {}
+        self._cache_lock = threading.Lock()
         logger.info(f"DatabaseService initialized with path: {self.db_path}")
     
     def get_user_for_query(self, query_id: int) -> Tuple[Optional[int], Optional[str]]:
@@ -579,6 +519,11 @@ class DatabaseService:
         Returns:
             Tuple met (user_id, chat_id) of (None, None) als niet gevonden
         """
+        with self._cache_lock:
+            cached = self._query_user_cache.get(query_id)
+        if cached is not None:
+            return cached
+        
         try:
             with get_connection_context(self.db_path) as conn:
                 cursor = conn.cursor()
@@ -593,7 +538,9 @@ class DatabaseService:
                 
                 if not user_row:
                     return None, None
-                    
+                
+                with self._cache_lock:
+                    self._query_user_cache[query_id] = (user_row[0], user_row[1])
                 return user_row[0], user_row[1]
         except Exception as e:
             logger.exception(f"Error getting user for query: {e}")
@@ -644,29 +591,24 @@ class DatabaseService:
             with get_connection_context(self.db_path) as conn:
                 cursor = conn.cursor()
                 
-                # Lowest recorded price
+                # Lowest (positive) and highest recorded price in one statement; SQLite returns
+                # the change_date of the row that holds the MIN/MAX value
                 cursor.execute("""
-                    SELECT MIN(new_price), change_date FROM price_history 
-                    WHERE product_id = ? AND new_price > 0
-                    GROUP BY product_id
-                """, (product_id,))
-                lowest_row = cursor.fetchone()
-                
-                if lowest_row:
-                    result['lowest_price'] = lowest_row[0]
-                    result['lowest_price_date'] = datetime.fromisoformat(lowest_row[1]) if lowest_row[1] else None
+                    SELECT lo.price, lo.change_date, hi.price, hi.change_date
+                    FROM (SELECT MIN(new_price) AS price, change_date FROM price_history
+                          WHERE product_id = ? AND new_price > 0) AS lo,
+                         (SELECT MAX(new_price) AS price, change_date FROM price_history
+                          WHERE product_id = ?) AS hi
+                """, (product_id, product_id))
+                lowest_price, lowest_date, highest_price, highest_date = cursor.fetchone()
                 
-                # Highest recorded price
-                cursor.execute("""
-                    SELECT MAX(new_price), change_date FROM price_history 
-                    WHERE product_id = ?
-                    GROUP BY product_id
-                """, (product_id,))
-                highest_row = cursor.fetchone()
+                if lowest_price is not None:
+                    result['lowest_price'] = lowest_price
+                    result['lowest_price_date'] = datetime.fromisoformat(lowest_date) if lowest_date else None
                 
-                if highest_row:
-                    result['highest_price'] = highest_row[0]
-                    result['highest_price_date'] = datetime.fromisoformat(highest_row[1]) if highest_row[1] else None
+                if highest_price is not None:
+                    result['highest_price'] = highest_price
+                    result['highest_price_date'] = datetime.fromisoformat(highest_date) if highest_date else None
                     
                 return result
         except Exception as e:
@@ -701,63 +643,109 @@ class DatabaseService:
                 notification_id = cursor.lastrowid
                 
                 # Update statistieken in dezelfde transactie
-                is_new_product = notification_type == "new_product"
-                is_price_drop = notification_type == "price_drop"
-                is_price_increase = notification_type == "price_increase"
-                
-                # Get current query execution to update stats
-                cursor.execute("""
-                    SELECT id FROM query_executions 
-                    WHERE query_id = ? 
-                    ORDER BY execution_date DESC 
-                    LIMIT 1
-                """, (query_id,))
-                
-                execution_row = cursor.fetchone()
-                
-                if execution_row:
-                    query_execution_id = execution_row[0]
-                    
-                    # Check if we already have stats for this execution
-                    cursor.execute("""
-                        SELECT id, new_product_count, price_drop_count, price_increase_count 
-                        FROM notification_stats 
-                        WHERE query_execution_id = ? AND user_id = ?
-                    """, (query_execution_id, user_id))
-                    
-                    stats_row = cursor.fetchone()
-                    
-                    if stats_row:
-                        # Update existing stats
-                        stats_id = stats_row[0]
-                        new_count = stats_row[1] + (1 if is_new_product else 0)
-                        drop_count = stats_row[2] + (1 if is_price_drop else 0)
-                        increase_count = stats_row[3] + (1 if is_price_increase else 0)
-                        total_count = new_count + drop_count + increase_count
-                        
-                        cursor.execute("""
-                            UPDATE notification_stats 
-                            SET new_product_count = ?, price_drop_count = ?, price_increase_count = ?, total_notifications = ?
-                            WHERE id = ?
-                        """, (new_count, drop_count, increase_count, total_count, stats_id))
-                    else:
-                        # Create new stats
-                        cursor.execute('''
-                            INSERT INTO notification_stats 
-                            (query_execution_id, user_id, query_id, new_product_count, price_drop_count, 
-                            price_increase_count, total_notifications)
-                            VALUES (?, ?, ?, ?, ?, ?, ?)
-                        ''', (query_execution_id, user_id, query_id, 
-                            1 if is_new_product else 0,
-                            1 if is_price_drop else 0,
-                            1 if is_price_increase else 0,
-                            1))
+                self._add_notification_stats(
+                    cursor, query_id, user_id,
+                    1 if notification_type == "new_product" else 0,
+                    1 if notification_type == "price_drop" else 0,
+                    1 if notification_type == "price_increase" else 0
+                )
             
             return notification_id
         except Exception as e:
             logger.exception(f"Error saving notification: {e}")
             return None
     
+    def save_notifications(self, notifications: List[Tuple]) -> bool:
+        """
+        Sla meerdere notificaties op in één transactie en update de statistieken per query en gebruiker.
+        
+        Args:
+            notifications: Lijst met tuples (user_id, query_id, product_id, notification_type, old_price,
+                new_price, discount_amount, discount_percentage, message, chat_id)
+            
+        Returns:
+            True als succesvol, False bij fout
+        """
+        if not notifications:
+            return True
+        
+        try:
+            with get_connection_context(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.executemany('''
+                    INSERT INTO notifications 
+                    (user_id, query_id, product_id, notification_type, old_price, new_price, 
+                    discount_amount, discount_percentage, message_text, chat_id)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', notifications)
+                
+                # Tel de notificatietypes per (query_id, user_id) en werk de statistieken één keer bij
+                counts = {}
+                for user_id, query_id, _, notification_type, *_ in notifications:
+                    new_count, drop_count, increase_count = counts.get((query_id, user_id), (0, 0, 0))
+                    counts[(query_id, user_id)] = (
+                        new_count + (notification_type == "new_product"),
+                        drop_count + (notification_type == "price_drop"),
+                        increase_count + (notification_type == "price_increase")
+                    )
+                
+                for (query_id, user_id), (new_count, drop_count, increase_count) in counts.items():
+                    self._add_notification_stats(cursor, query_id, user_id, new_count, drop_count, increase_count)
+            
+            return True
+        except Exception as e:
+            logger.exception(f"Error saving {len(notifications)} notifications: {e}")
+            return False
+    
+    def _add_notification_stats(self, cursor, query_id: int, user_id: int,
+                                new_count: int, drop_count: int, increase_count: int) -> None:
+        """Tel notificaties op bij de statistieken van de laatste uitvoering van een query."""
+        # Get current query execution to update stats
+        cursor.execute("""
+            SELECT id FROM query_executions 
+            WHERE query_id = ? 
+            ORDER BY execution_date DESC 
+            LIMIT 1
+        """, (query_id,))
+        
+        execution_row = cursor.fetchone()
+        if not execution_row:
+            return
+        
+        query_execution_id = execution_row[0]
+        
+        # Check if we already have stats for this execution
+        cursor.execute("""
+            SELECT id, new_product_count, price_drop_count, price_increase_count 
+            FROM notification_stats 
+            WHERE query_execution_id = ? AND user_id = ?
+        """, (query_execution_id, user_id))
+        
+        stats_row = cursor.fetchone()
+        
+        if stats_row:
+            # Update existing stats
+            stats_id = stats_row[0]
+            new_count += stats_row[1]
+            drop_count += stats_row[2]
+            increase_count += stats_row[3]
+            total_count = new_count + drop_count + increase_count
+            
+            cursor.execute("""
+                UPDATE notification_stats 
+                SET new_product_count = ?, price_drop_count = ?, price_increase_count = ?, total_notifications = ?
+                WHERE id = ?
+            """, (new_count, drop_count, increase_count, total_count, stats_id))
+        else:
+            # Create new stats
+            cursor.execute('''
+                INSERT INTO notification_stats 
+                (query_execution_id, user_id, query_id, new_product_count, price_drop_count, 
+                price_increase_count, total_notifications)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (query_execution_id, user_id, query_id, new_count, drop_count, increase_count,
+                  new_count + drop_count + increase_count))
+    
     def get_active_queries(self) -> List[Tuple]:
         """
         Haal alle actieve queries op.
@@ -814,32 +802,40 @@ class DatabaseService:
             with get_connection_context(self.db_path) as conn:
                 cursor = conn.cursor()
                 
+                # Dubbele producten in één resultaat worden maar één keer verwerkt;
+                # het eerste exemplaar blijft op zijn plek staan
+                seen_codes = set()
+                unique_products = []
                 for product in products:
-                    # Check if product already exists
-                    cursor.execute("SELECT id, price FROM products WHERE query_id = ? AND code = ?", (query_id, product.id))
-                    existing_product = cursor.fetchone()
+                    if product.id not in seen_codes:
+                        seen_codes.add(product.id)
+                        unique_products.append(product)
+                
+                # Haal alle bestaande producten in één keer op in plaats van per product
+                existing_products = self._get_existing_products(cursor, query_id, [p.id for p in unique_products])
+                
+                new_rows = []
+                new_notifications = []
+                price_updates = []
+                history_rows = []
+                change_date = datetime.now()
+                
+                for product in unique_products:
+                    existing_product = existing_products.get(str(product.id))
                     
                     if not existing_product:
                         # New product, add it
-                        cursor.execute(
-                            """
-                            INSERT INTO products (query_id, code, label, price, image_url, product_url, recommended_price, 
-                            discount_amount, discount_percentage)
-                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                            """,
-                            (query_id, product.id, product.name, product.price, product.image_url, product.product_url, 
-                             product.recommended_price, product.discount_amount, product.discount_percentage),
-                        )
-                        
-                        product_row_id = cursor.lastrowid
+                        new_rows.append((query_id, product.id, product.name, product.price, product.image_url, 
+                                         product.product_url, product.recommended_price, product.discount_amount, 
+                                         product.discount_percentage))
                         
-                        logger.info(f"New product found for query {query_id}: {product.name}")
+                        logger.info("New product found for query %s: %s", query_id, product.name)
                         new_products_count += 1
                         
-                        # Add notification to list
-                        notifications.append({
+                        # Add notification to list; product_id wordt na de insert ingevuld
+                        notification = {
                             'query_id': query_id,
-                            'product_id': product_row_id,
+                            'product_id': None,
                             'label': product.name,
                             'new_price': product.price,
                             'old_price': product.old_price,
@@ -848,35 +844,27 @@ class DatabaseService:
                             'notification_type': "new_product",
                             'discount_amount': product.discount_amount,
                             'discount_percentage': product.discount_percentage
-                        })
+                        }
+                        notifications.append(notification)
+                        new_notifications.append((product.id, notification))
                     else:
                         # Check if price has changed
-                        existing_id = existing_product[0]
-                        existing_price = existing_product[1]
+                        existing_id, existing_price = existing_product
                         
                         if product.price != existing_price:
                             # Determine type of price change
                             notification_type = "price_drop" if product.price < existing_price else "price_increase"
                             
                             # Update product price and discount information
-                            cursor.execute("""
-                                UPDATE products 
-                                SET price = ?, recommended_price = ?, discount_amount = ?, discount_percentage = ? 
-                                WHERE id = ?
-                            """, (product.price, product.recommended_price, product.discount_amount, 
-                                 product.discount_percentage, existing_id))
+                            price_updates.append((product.price, product.recommended_price, product.discount_amount, 
+                                                  product.discount_percentage, existing_id))
                             
                             # Log the price change in price_history table
-                            cursor.execute(
-                                """
-                                INSERT INTO price_history (product_id, old_price, new_price, discount_amount, discount_percentage, change_date)
-                                VALUES (?, ?, ?, ?, ?, ?)
-                                """,
-                                (existing_id, existing_price, product.price, 
-                                 product.discount_amount, product.discount_percentage, datetime.now()),
-                            )
+                            history_rows.append((existing_id, existing_price, product.price, 
+                                                 product.discount_amount, product.discount_percentage, change_date))
                             
-                            logger.info(f"Price updated for product {query_id}: {product.name} from {existing_price} to {product.price}")
+                            logger.info("Price updated for product %s: %s from %s to %s",
+                                        query_id, product.name, existing_price, product.price)
                             price_changes_count += 1
                             
                             # Add notification to list
@@ -893,12 +881,67 @@ class DatabaseService:
                                 'discount_percentage': product.discount_percentage
                             })
                 
+                if new_rows:
+                    cursor.executemany(
+                        """
+                        INSERT INTO products (query_id, code, label, price, image_url, product_url, recommended_price, 
+                        discount_amount, discount_percentage)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        """,
+                        new_rows,
+                    )
+                    
+                    # Koppel de nieuwe database IDs aan de notificaties
+                    inserted = self._get_existing_products(cursor, query_id, [code for code, _ in new_notifications])
+                    for code, notification in new_notifications:
+                        notification['product_id'] = inserted[str(code)][0]
+                
+                if price_updates:
+                    cursor.executemany("""
+                        UPDATE products 
+                        SET price = ?, recommended_price = ?, discount_amount = ?, discount_percentage = ? 
+                        WHERE id = ?
+                    """, price_updates)
+                    
+                    cursor.executemany(
+                        """
+                        INSERT INTO price_history (product_id, old_price, new_price, discount_amount, discount_percentage, change_date)
+                        VALUES (?, ?, ?, ?, ?, ?)
+                        """,
+                        history_rows,
+                    )
+                
                 conn.commit()
                 return (new_products_count, price_changes_count, notifications)
         except Exception as e:
             logger.exception(f"Error processing products for query {query_id}: {e}")
             return (0, 0, [])
     
+    def _get_existing_products(self, cursor, query_id: int, codes: List[str]) -> Dict[str, Tuple[int, float]]:
+        """
+        Zoek bestaande producten voor een query op in zo min mogelijk queries.
+        
+        Args:
+            cursor: Cursor van de lopende transactie
+            query_id: ID van de query
+            codes: Productcodes om op te zoeken
+            
+        Returns:
+            Dictionary van productcode (als string) naar (id, price)
+        """
+        existing = {}
+        for start in range(0, len(codes), _MAX_IN_PARAMS):
+            chunk = codes[start:start + _MAX_IN_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT code, id, price FROM products WHERE query_id = ? AND code IN ({placeholders}) ORDER BY id",
+                (query_id, *chunk)
+            )
+            for code, product_id, price in cursor.fetchall():
+                # Codes worden als TEXT opgeslagen; bij dubbele rijen telt de oudste
+                existing.setdefault(str(code), (product_id, price))
+        return existing
+    
     def log_query_execution_result(self, query_id: int, api_url: str, success: bool, 
                                  total_products: int, new_products: int, price_changes: int,
                                  error_message: str = None, response_status: int = None, 
@@ -942,19 +985,17 @@ class DatabaseService:
         try:
             with get_connection_context(self.db_path) as conn:
                 cursor = conn.cursor()
-                # Get user_id for the foreign key
-                cursor.execute("SELECT id FROM users WHERE chat_id=?", (chat_id,))
-                user = cursor.fetchone()
-                
-                if not user:
-                    return False, "Er ging iets mis. Probeer opnieuw met /start."
-
-                user_id = user[0]
+                # Zoek de user_id op en voeg de query toe in één statement
                 cursor.execute(
-                    "INSERT INTO queries (user_id, query_name, query_text) VALUES (?,?,?)",
-                    (user_id, query_name, query_text)
+                    "INSERT INTO queries (user_id, query_name, query_text) SELECT id, ?, ? FROM users WHERE chat_id=?",
+                    (query_name, query_text, chat_id)
                 )
+                
+                if cursor.rowcount == 0:
+                    return False, "Er ging iets mis. Probeer opnieuw met /start."
+                
                 conn.commit()
+                self._invalidate_chat_queries(chat_id)
                 return True, f"Zoekopdracht '{query_name}' is toegevoegd."
         except Exception as e:
             logger.exception(f"Error adding query for chat_id {chat_id}: {e}")
@@ -1027,6 +1068,44 @@ class DatabaseService:
             logger.exception(f"Error updating language for user {chat_id}: {e}")
             return False
     
+    def _get_chat_queries(self, chat_id: str) -> List[Tuple]:
+        """
+        Haal alle queries van een chat ID op, uit de cache indien mogelijk.
+        
+        Args:
+            chat_id: De chat ID van de gebruiker
+            
+        Returns:
+            Lijst met query tuples (id, query_name, query_text, interval_minutes, paused)
+        """
+        with self._cache_lock:
+            cached = self._chat_queries_cache.get(chat_id)
+        if cached is not None:
+            return cached
+        
+        with get_connection_context(self.db_path) as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+                SELECT q.id, q.query_name, q.query_text, q.interval_minutes, q.paused
+                FROM queries q
+                JOIN users u ON q.user_id = u.id
+                WHERE u.chat_id = ?
+                ORDER BY q.id
+            """, (chat_id,))
+            rows = cursor.fetchall()
+        
+        with self._cache_lock:
+            self._chat_queries_cache[chat_id] = rows
+        return rows
+    
+    def _invalidate_chat_queries(self, chat_id: Optional[str] = None) -> None:
+        """Vergeet gecachte queries van een chat ID, of van alle chats als er geen chat ID is."""
+        with self._cache_lock:
+            if chat_id is None:
+                self._chat_queries_cache.clear()
+            else:
+                self._chat_queries_cache.pop(chat_id, None)
+    
     def get_queries_for_chat_id(self, chat_id: str) -> List[Tuple]:
         """
         Haal alle queries op voor een chat ID.
@@ -1038,15 +1117,8 @@ class DatabaseService:
             Lijst met query tuples (id, query_name, interval_minutes, paused)
         """
         try:
-            with get_connection_context(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT q.id, q.query_name, q.interval_minutes, q.paused
-                    FROM queries q
-                    JOIN users u ON q.user_id = u.id
-                    WHERE u.chat_id = ?
-                """, (chat_id,))
-                return cursor.fetchall()
+            return [(query_id, name, interval, paused)
+                    for query_id, name, _, interval, paused in self._get_chat_queries(chat_id)]
         except Exception as e:
             logger.exception(f"Error getting queries for chat_id {chat_id}: {e}")
             return []
@@ -1062,15 +1134,8 @@ class DatabaseService:
             Lijst met query tuples (id, query_name, query_text)
         """
         try:
-            with get_connection_context(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT q.id, q.query_name, q.query_text
-                    FROM queries q
-                    JOIN users u ON q.user_id = u.id
-                    WHERE u.chat_id = ? AND q.paused = 0
-                """, (chat_id,))
-                return cursor.fetchall()
+            return [(query_id, name, text)
+                    for query_id, name, text, _, paused in self._get_chat_queries(chat_id) if not paused]
         except Exception as e:
             logger.exception(f"Error getting active queries for chat_id {chat_id}: {e}")
             return []
@@ -1086,15 +1151,8 @@ class DatabaseService:
             Lijst met query tuples (id, query_name, query_text)
         """
         try:
-            with get_connection_context(self.db_path) as conn:
-                cursor = conn.cursor()
-                cursor.execute("""
-                    SELECT q.id, q.query_name, q.query_text
-                    FROM queries q
-                    JOIN users u ON q.user_id = u.id
-                    WHERE u.chat_id = ? AND q.paused = 1
-                """, (chat_id,))
-                return cursor.fetchall()
+            return [(query_id, name, text)
+                    for query_id, name, text, _, paused in self._get_chat_queries(chat_id) if paused]
         except Exception as e:
             logger.exception(f"Error getting paused queries for chat_id {chat_id}: {e}")
             return []
@@ -1136,6 +1194,7 @@ class DatabaseService:
                 cursor = conn.cursor()
                 cursor.execute("UPDATE queries SET paused = 1 WHERE id = ?", (query_id,))
                 conn.commit()
+                self._invalidate_chat_queries()
                 return True
         except Exception as e:
             logger.exception(f"Error pausing query {query_id}: {e}")
@@ -1156,6 +1215,7 @@ class DatabaseService:
                 cursor = conn.cursor()
                 cursor.execute("UPDATE queries SET paused = 0 WHERE id = ?", (query_id,))
                 conn.commit()
+                self._invalidate_chat_queries()
                 return True
         except Exception as e:
             logger.exception(f"Error resuming query {query_id}: {e}")
@@ -1176,7 +1236,85 @@ class DatabaseService:
                 cursor = conn.cursor()
                 cursor.execute("DELETE FROM queries WHERE id = ?", (query_id,))
                 conn.commit()
-                return True
+            with self._cache_lock:
+                self._query_user_cache.pop(query_id, None)
+            self._invalidate_chat_queries()
+            return True
+        except Exception as e:
+            logger.exception(f"Error deleting query {query_id}: {e}")
+            return False
+    
+    def pause_query_for_chat_id(self, query_id: int, chat_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        Pauzeer een query, maar alleen als deze van de gegeven chat ID is.
+        
+        Args:
+            query_id: De ID van de query
+            chat_id: De chat ID van de eigenaar
+            
+        Returns:
+            Tuple met (gevonden, query_name)
+        """
+        return self._set_query_paused_for_chat_id(query_id, chat_id, True)
+    
+    def resume_query_for_chat_id(self, query_id: int, chat_id: str) -> Tuple[bool, Optional[str]]:
+        """
+        Hervat een query, maar alleen als deze van de gegeven chat ID is.
+        
+        Args:
+            query_id: De ID van de query
+            chat_id: De chat ID van de eigenaar
+            
+        Returns:
+            Tuple met (gevonden, query_name)
+        """
+        return self._set_query_paused_for_chat_id(query_id, chat_id, False)
+    
+    def _set_query_paused_for_chat_id(self, query_id: int, chat_id: str, paused: bool) -> Tuple[bool, Optional[str]]:
+        """Zet de paused status van een query van deze chat ID en geef de naam terug, in één transactie."""
+        try:
+            with get_connection_context(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute("""
+                    SELECT q.query_name FROM queries q
+                    JOIN users u ON q.user_id = u.id
+                    WHERE q.id = ? AND u.chat_id = ?
+                """, (query_id, chat_id))
+                row = cursor.fetchone()
+                if not row:
+                    return False, None
+                cursor.execute("UPDATE queries SET paused = ? WHERE id = ?", (1 if paused else 0, query_id))
+                conn.commit()
+                self._invalidate_chat_queries(chat_id)
+                return True, row[0]
+        except Exception as e:
+            logger.exception(f"Error setting paused={paused} for query {query_id}: {e}")
+            return False, None
+    
+    def delete_query_for_chat_id(self, query_id: int, chat_id: str) -> bool:
+        """
+        Verwijder een query, maar alleen als deze van de gegeven chat ID is.
+        
+        Args:
+            query_id: De ID van de query
+            chat_id: De chat ID van de eigenaar
+            
+        Returns:
+            True als de query is verwijderd, False als niet gevonden of bij fout
+        """
+        try:
+            with get_connection_context(self.db_path) as conn:
+                cursor = conn.cursor()
+                cursor.execute(
+                    "DELETE FROM queries WHERE id = ? AND user_id = (SELECT id FROM users WHERE chat_id = ?)",
+                    (query_id, chat_id)
+                )
+                deleted = cursor.rowcount > 0
+                conn.commit()
+            with self._cache_lock:
+                self._query_user_cache.pop(query_id, None)
+            self._invalidate_chat_queries(chat_id)
+            return deleted
         except Exception as e:
             logger.exception(f"Error deleting query {query_id}: {e}")
             return False
@@ -1194,9 +1332,9 @@ class DatabaseService:
         try:
             with get_connection_context(self.db_path) as conn:
                 cursor = conn.cursor()
-                cursor.execute("SELECT COUNT(*) FROM query_executions WHERE query_id = ?", (query_id,))
-                count = cursor.fetchone()[0]
-                return count == 0
+                # EXISTS stopt bij de eerste gevonden uitvoering in plaats van alle uitvoeringen te tellen
+                cursor.execute("SELECT EXISTS (SELECT 1 FROM query_executions WHERE query_id = ?)", (query_id,))
+                return not cursor.fetchone()[0]
         except Exception as e:
             logger.exception(f"Error checking initial query execution for query ID {query_id}: {e}")
             return False
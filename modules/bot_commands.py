@@ -3,10 +3,8 @@ Bot commands module handles all Telegram command interactions.
 This module contains handlers for different commands like start, menu, etc.
 """
 import logging
-import re
 from telegram import Update, InlineKeyboardMarkup, InlineKeyboardButton
 from telegram.ext import ContextTypes
-from config import TOKEN
 import database
 
 # Logger specifiek voor deze module configureren
@@ -106,22 +104,17 @@ async def menu_callback_handler(update: Update, context: ContextTypes.DEFAULT_TY
     
     logger.info(f"MENU keuze: {choice} van gebruiker {user.username} ({user.id})")
 
-    if choice == "menu_list_queries":
-        await query.edit_message_text("Je huidige zoekopdrachten:")
-        await list_queries(update, context)
-
-    elif choice == "menu_pause_query":
-        await query.edit_message_text("Pauzeer een zoekopdracht:")
-        await pause_query(update, context)
-
-    elif choice == "menu_resume_query":
-        await query.edit_message_text("Hervat een zoekopdracht:")
-        await resume_query(update, context)
-
-    elif choice == "menu_delete_query":
-        # Voor het verwijderen hoeven we de tekst niet te wijzigen, maar direct de delete_query functie aanroepen
-        # Dit voorkomt de 'NoneType' heeft geen 'reply_text' attribuut foutmelding
-        await delete_query(update, context)
+    action = _MENU_ACTIONS.get(choice)
+    if action is None:
+        logger.warning(f"Onbekende menu keuze: {choice}")
+        return
+    
+    header, handler = action
+    # Voor het verwijderen wordt de tekst niet gewijzigd, maar direct de delete_query functie aangeroepen
+    # Dit voorkomt de 'NoneType' heeft geen 'reply_text' attribuut foutmelding
+    if header:
+        await query.edit_message_text(header)
+    await handler(update, context)
 
 async def list_queries(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """List all queries for the user."""
@@ -134,13 +127,11 @@ async def list_queries(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if not rows:
         message_text = "Geen zoekopdrachten gevonden."
     else:
-        reply_lines = []
-        for i, row in enumerate(rows, start=1):
-            query_name = row[1] or f"Query #{row[0]}"
-            interval_minutes = row[2]
-            paused_status = "Gepauzeerd" if row[3] else "Actief"
-            reply_lines.append(f"{i}. {query_name} | Interval: {interval_minutes}m | Status: {paused_status}")
-        message_text = "\n".join(reply_lines)
+        message_text = "\n".join(
+            f"{i}. {query_name or f'Query #{query_id}'} | Interval: {interval_minutes}m | "
+            f"Status: {'Gepauzeerd' if paused else 'Actief'}"
+            for i, (query_id, query_name, interval_minutes, paused) in enumerate(rows, start=1)
+        )
 
     # Handle different update types
     if update.callback_query:
@@ -197,19 +188,19 @@ async def pause_query_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     query = update.callback_query
     await query.answer()
     
-    # Extract query_id from callback data
-    query_id = query.data.split("_")[1]
+    # Extract query_id from callback data (as int, like the cache keys in the database service)
+    query_id = int(query.data.partition("_")[2])
+    chat_id = str(query.message.chat_id)
     
-    # Gebruik de database service
+    # Gebruik de database service; controleert eigenaar en werkt bij in één aanroep
     db = database.db_service
-    query_name = db.get_query_name(query_id)
+    found, query_name = db.pause_query_for_chat_id(query_id, chat_id)
     
-    if not query_name:
+    if not found:
         await query.edit_message_text("Zoekopdracht niet gevonden.")
         return
     
     display_name = query_name or f"Query #{query_id}"
-    db.pause_query(query_id)
     
     await query.edit_message_text(f"Zoekopdracht '{display_name}' is gepauzeerd.")
 
@@ -262,19 +253,19 @@ async def resume_query_callback(update: Update, context: ContextTypes.DEFAULT_TY
     query = update.callback_query
     await query.answer()
     
-    # Extract query_id from callback data
-    query_id = query.data.split("_")[1]
+    # Extract query_id from callback data (as int, like the cache keys in the database service)
+    query_id = int(query.data.partition("_")[2])
+    chat_id = str(query.message.chat_id)
     
-    # Gebruik de database service
+    # Gebruik de database service; controleert eigenaar en werkt bij in één aanroep
     db = database.db_service
-    query_name = db.get_query_name(query_id)
+    found, query_name = db.resume_query_for_chat_id(query_id, chat_id)
     
-    if not query_name:
+    if not found:
         await query.edit_message_text("Zoekopdracht niet gevonden.")
         return
     
     display_name = query_name or f"Query #{query_id}"
-    db.resume_query(query_id)
     
     await query.edit_message_text(f"Zoekopdracht '{display_name}' is hervat.")
 
@@ -317,115 +308,21 @@ async def delete_query_callback(update: Update, context: ContextTypes.DEFAULT_TY
     if not data.startswith("delete_"):
         return
 
-    query_id = data.split("_")[1]
+    query_id = int(data.partition("_")[2])
+    chat_id = str(query.message.chat_id)
     
-    # Gebruik de database service
+    # Gebruik de database service; alleen eigen zoekopdrachten kunnen worden verwijderd
     db = database.db_service
-    db.delete_query(query_id)
-
-    await query.edit_message_text("Zoekopdracht is verwijderd.")
-
-async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    message_text = update.message.text
-    chat_id = str(update.effective_chat.id)
-
-    # Check if we're waiting for a query label
-    if 'awaiting_label' in context.user_data and 'pending_query' in context.user_data:
-        label = message_text
-        query = context.user_data.pop('pending_query')
-        context.user_data.pop('awaiting_label')
-        await add_query_with_label(update, context, query, label)
-    # Check if the message contains a URL
-    elif "http" in message_text:
-        context.user_data['pending_query'] = message_text
-        
-        # Create inline keyboard with Yes and No buttons
-        keyboard = [
-            [
-                InlineKeyboardButton("Yes", callback_data="query_yes"),
-                InlineKeyboardButton("No", callback_data="query_no")
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
-        
-        await update.message.reply_text(
-            'Do you want to add this query?',
-            reply_markup=reply_markup
-        )
-    else:
-        # Handle other messages
-        await update.message.reply_text("Sorry, I didn't understand that. Please send a valid URL.")
-
-async def handle_text_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """
-    Combined handler for all text messages:
-    - Processes URLs when relevant
-    - Processes query names when expected
-    """
-    text = update.message.text
-
-    # Handle query name input
-    if context.user_data.get("await_queryname"):
-        await handle_query_name_input(update, context)
-        return
-
-    # Handle URLs
-    if "lidl.nl" in text:
-        await handle_url_input(update, context)
-        return
-
-async def handle_query_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Process query name input."""
-    chat_id = str(update.effective_chat.id)
-    query_name = update.message.text
-    api_query = context.user_data.get("pending_query")
-
-    if not api_query:
-        await update.message.reply_text("Er ging iets mis. Probeer de URL opnieuw te plakken.")
-        context.user_data["await_queryname"] = False
+    if not db.delete_query_for_chat_id(query_id, chat_id):
+        await query.edit_message_text("Zoekopdracht niet gevonden.")
         return
 
-    # Gebruik de database service om de query toe te voegen
-    try:
-        # Gebruik de database service methode rechtstreeks
-        db = database.db_service
-        success, message = db.add_query_for_chat_id(chat_id, query_name, api_query)
-        await update.message.reply_text(message)
-    except Exception as e:
-        logger.exception(f"Error saving query: {e}")
-        await update.message.reply_text("Er ging iets mis bij het opslaan van de query.")
-
-    context.user_data["pending_query"] = None
-    context.user_data["await_queryname"] = False
-
-async def handle_url_input(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Process URL input."""
-    text = update.message.text
-    context.user_data["pending_query"] = convert_lidl_url_to_api(text)
-    
-    # Show inline Yes/No buttons
-    keyboard = [
-        [
-            InlineKeyboardButton("Ja", callback_data="confirm_query"),
-            InlineKeyboardButton("Nee", callback_data="cancel_query")
-        ]
-    ]
-    await update.message.reply_text(
-        text=f"URL gevonden:\n{context.user_data['pending_query']}\nWil je deze toevoegen?",
-        reply_markup=InlineKeyboardMarkup(keyboard),
-    )
-
-async def confirm_query_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Yes button clicked: ask for a name."""
-    query = update.callback_query
-    await query.answer()
-    await query.edit_message_text("Geef de naam voor deze zoekopdracht:")
-    context.user_data["await_queryname"] = True
+    await query.edit_message_text("Zoekopdracht is verwijderd.")
 
-async def cancel_query_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """No button clicked: cancel and clear pending_query."""
-    query = update.callback_query
-    await query.answer()
-    context.user_data["pending_query"] = None
-    context.user_data["await_queryname"] = False
-    await query.edit_message_text("Toevoegen afgebroken.")
\ No newline at end of file
+# Menu keuzes: callback_data -> (koptekst of None, handler)
+_MENU_ACTIONS = {
+    "menu_list_queries": ("Je huidige zoekopdrachten:", list_queries),
+    "menu_pause_query": ("Pauzeer een zoekopdracht:", pause_query),
+    "menu_resume_query": ("Hervat een zoekopdracht:", resume_query),
+    "menu_delete_query": (None, delete_query),
+}
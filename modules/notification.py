@@ -2,13 +2,29 @@
 Notification Module
 Handles generation and sending of notifications to users.
 """
+import asyncio
 import logging
-from datetime import datetime
+from operator import itemgetter
 from telegram import InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.error import BadRequest, RetryAfter, TelegramError
 import database
 
 logger = logging.getLogger(__name__)
 
+# Message templates, built once at import time
+_INITIAL_QUERY_TEMPLATE = (
+    "Zoekopdracht: {query_name} is voor het eerst uitgevoerd. "
+    "Er zijn {result_count} resultaten toegevoegd aan de database."
+)
+_HEADER_TEMPLATE = "Zoekopdracht: {}\n\n"
+_PRICE_HISTORY_HEADER = "\n\nPrijsgeschiedenis:"
+_LOWEST_PRICE_TEMPLATE = "\nLaagste prijs ooit: €{:.2f}"
+_HIGHEST_PRICE_TEMPLATE = "\nHoogste prijs ooit: €{:.2f}"
+_PRICE_DATE_TEMPLATE = " op {:%d-%m-%Y}"
+
+# Picks all price history fields out of db.get_price_history's dict in one call
+_price_history_fields = itemgetter('lowest_price', 'lowest_price_date', 'highest_price', 'highest_price_date')
+
 async def notify_initial_query(app, query_id: int, query_name: str, result_count: int, chat_id: int):
     """
     Send a summary notification to the user when a query is executed for the first time.
@@ -20,20 +36,121 @@ async def notify_initial_query(app, query_id: int, query_name: str, result_count
         result_count: Number of results added to the database
         chat_id: Chat ID to send the notification to
     """
-    message = f"Zoekopdracht: {query_name} is voor het eerst uitgevoerd. Er zijn {result_count} resultaten toegevoegd aan de database."
+    message = _INITIAL_QUERY_TEMPLATE.format(query_name=query_name, result_count=result_count)
     try:
         await app.bot.send_message(
             chat_id=chat_id,
             text=message,
             disable_web_page_preview=True
         )
-        logger.info(f"Initial query notification sent to {chat_id}: {query_name} with {result_count} results")
-    except Exception as e:
-        logger.error(f"Failed to send initial query notification to {chat_id}: {e}")
+        logger.info("Initial query notification sent to %s: %s with %s results", chat_id, query_name, result_count)
+    except TelegramError as e:
+        logger.error("Failed to send initial query notification to %s: %s", chat_id, e)
+
+def _format_product_body(notification_type: str, label: str, new_price: float, old_price: float,
+                         discount_amount: float, discount_percentage: float) -> str:
+    """Format the product part of a notification message."""
+    # Compose message body
+    if notification_type == "new_product":
+        body = f"Nieuw product gevonden: {label}\nPrijs: €{new_price:.2f}"
+        
+        # If it's a new product with immediate discount, show that info
+        if discount_amount and discount_percentage and discount_amount > 0:
+            body += f"\nAanbiedingsprijs! Korting: €{discount_amount:.2f} ({discount_percentage:.1f}%)"
+            if old_price and old_price > 0:
+                body += f"\nVan €{old_price:.2f} voor €{new_price:.2f}"
+    elif notification_type == "price_drop":
+        # Price reduction
+        body = f"Prijsverlaging voor {label}"
+        body += f"\nVan €{old_price:.2f} naar €{new_price:.2f}"
+        
+        if discount_amount and discount_percentage and discount_amount > 0:
+            body += f"\nJe bespaart: €{discount_amount:.2f} ({discount_percentage:.1f}%)"
+    else:
+        # Price increase
+        body = f"Prijsverhoging voor {label}"
+        body += f"\nVan €{old_price:.2f} naar €{new_price:.2f}"
+        
+        price_increase = new_price - old_price
+        percentage_increase = (price_increase / old_price) * 100
+        body += f"\nPrijsstijging: €{price_increase:.2f} ({percentage_increase:.1f}%)"
+    
+    return body
+
+async def _send_product_message(app, chat_id: int, message: str, product_url: str, image_url: str):
+    """
+    Send a product notification, with the image when available.
+    
+    A photo that Telegram rejects (BadRequest) is replaced by a text message with the URL.
+    When Telegram applies flood control (RetryAfter), waits the requested time and retries once.
+    Other Telegram errors are raised to the caller.
+    """
+    for attempt in range(2):
+        try:
+            if image_url:
+                try:
+                    # Als er een afbeelding is, stuur alles in één bericht
+                    await app.bot.send_photo(
+                        chat_id=chat_id,
+                        photo=image_url,
+                        caption=message,
+                        reply_markup=InlineKeyboardMarkup([
+                            [InlineKeyboardButton(text="Bekijk product", url=product_url)]
+                        ])
+                    )
+                    return
+                except BadRequest as e:
+                    # Als het bericht met afbeelding mislukt, stuur een fallback zonder afbeelding
+                    logger.warning("Photo rejected for %s, sending text instead: %s", chat_id, e)
+                    image_url = None
+            
+            # Als er geen afbeelding is, stuur alleen het bericht met de URL
+            await app.bot.send_message(
+                chat_id=chat_id,
+                text=f"{message}\n{product_url}",
+                disable_web_page_preview=True
+            )
+            return
+        except RetryAfter as e:
+            if attempt:
+                raise
+            logger.warning("Flood control for %s, retrying in %ss", chat_id, e.retry_after)
+            await asyncio.sleep(e.retry_after)
+
+def _load_notification_context(db, query_id: int, product_id: int, label: str, notification_type: str):
+    """
+    Run the blocking database lookups for a notification; called in a worker thread.
+    
+    Returns:
+        tuple: (user_id, chat_id, is_initial, query_name, product_id, price_history);
+        price_history is None for new products or when there is no product_id
+    """
+    # Get user information
+    user_id, chat_id = db.get_user_for_query(query_id)
+    if not user_id or not chat_id:
+        return user_id, chat_id, False, None, product_id, None
+    
+    is_initial = db.is_initial_query_execution(query_id)
+    
+    # Get query name
+    query_name = db.get_query_name(query_id) or f"Query #{query_id}"
+    if is_initial:
+        return user_id, chat_id, True, query_name, product_id, None
+    
+    # If new product but product_id not provided, try to look it up
+    if notification_type == "new_product" and not product_id and label:
+        product_id = db.find_product_id_by_label(query_id, label)
+    
+    # Get price history if we have a product_id and it's not a new product
+    price_history = None
+    if product_id and notification_type != "new_product":
+        price_history = db.get_price_history(product_id)
+    
+    return user_id, chat_id, False, query_name, product_id, price_history
 
 async def notify_user(app, query_id: int, product_id: int = None, label: str = None, new_price: float = None, 
                old_price: float = None, product_url: str = None, image_url: str = None, notification_type: str = None,
-               discount_amount: float = None, discount_percentage: float = None):
+               discount_amount: float = None, discount_percentage: float = None, notification_log: list = None):
     """
     Send notification to user about a new product or price change.
     Includes discount information when available and price history.
@@ -50,98 +167,66 @@ async def notify_user(app, query_id: int, product_id: int = None, label: str = N
         notification_type: Type of notification ('new_product', 'price_drop', 'price_increase')
         discount_amount: Discount amount (if available)
         discount_percentage: Discount percentage (if available)
+        notification_log: Optional list to collect the notification row in, so the caller can
+            store a whole batch with db.save_notifications instead of one insert per message
+    
+    Returns:
+        The notification ID, or None when the notification is collected in notification_log
     """
     # Gebruik de database service in plaats van directe verbindingen
     db = database.db_service
     
-    # Get user information
-    user_id, chat_id = db.get_user_for_query(query_id)
+    # All lookups are blocking SQLite calls; run them together in one worker thread
+    # so the event loop stays free and each notification holds one pooled connection at a time
+    user_id, chat_id, is_initial, query_name, product_id, price_history = await asyncio.to_thread(
+        _load_notification_context, db, query_id, product_id, label, notification_type
+    )
     
     # If we couldn't get user_id or chat_id, we can't continue
     if not user_id or not chat_id:
-        logger.error(f"Could not retrieve user_id or chat_id for notification. Query ID: {query_id}")
+        logger.error("Could not retrieve user_id or chat_id for notification. Query ID: %s", query_id)
         return
     
     # Check if this is the initial execution of the query
-    if db.is_initial_query_execution(query_id):
-        query_name = db.get_query_name(query_id) or f"Query #{query_id}"
-        result_count = db.get_result_count_for_query(query_id)
+    if is_initial:
+        result_count = await asyncio.to_thread(db.get_result_count_for_query, query_id)
         await notify_initial_query(app, query_id, query_name, result_count, chat_id)
         return
     
-    # If new product but product_id not provided, try to look it up
-    if notification_type == "new_product" and not product_id and label:
-        product_id = db.find_product_id_by_label(query_id, label)
-    
-    # Get query name
-    query_name = db.get_query_name(query_id) or f"Query #{query_id}"
-    
-    # Get price history if we have a product_id and it's not a new product
-    lowest_price = None
-    lowest_price_date = None
-    highest_price = None
-    highest_price_date = None
-    
-    if product_id and notification_type != "new_product":
-        price_history = db.get_price_history(product_id)
-        lowest_price = price_history['lowest_price']
-        lowest_price_date = price_history['lowest_price_date']
-        highest_price = price_history['highest_price']
-        highest_price_date = price_history['highest_price_date']
-    
-    # Compose message based on notification_type
-    is_new_product = notification_type == "new_product"
-    is_price_drop = notification_type == "price_drop"
-    is_price_increase = notification_type == "price_increase"
+    # Price history is only available for price changes of known products
+    if price_history is not None:
+        lowest_price, lowest_price_date, highest_price, highest_price_date = _price_history_fields(price_history)
+    else:
+        lowest_price = lowest_price_date = highest_price = highest_price_date = None
     
-    # Compose message header with query name
-    message = f"Zoekopdracht: {query_name}\n\n"
+    # Compose message header with query name, then the body; joined once at the end
+    parts = [
+        _HEADER_TEMPLATE.format(query_name),
+        _format_product_body(notification_type, label, new_price, old_price,
+                             discount_amount, discount_percentage)
+    ]
     
-    # Compose message body
-    if is_new_product:
-        message += f"Nieuw product gevonden: {label}\nPrijs: €{new_price:.2f}"
-        
-        # If it's a new product with immediate discount, show that info
-        if discount_amount and discount_percentage and discount_amount > 0:
-            message += f"\nAanbiedingsprijs! Korting: €{discount_amount:.2f} ({discount_percentage:.1f}%)"
-            if old_price and old_price > 0:
-                message += f"\nVan €{old_price:.2f} voor €{new_price:.2f}"
-    else:
-        # It's a price change
-        if is_price_drop:
-            # Price reduction
-            message += f"Prijsverlaging voor {label}"
-            message += f"\nVan €{old_price:.2f} naar €{new_price:.2f}"
-            
-            if discount_amount and discount_percentage and discount_amount > 0:
-                message += f"\nJe bespaart: €{discount_amount:.2f} ({discount_percentage:.1f}%)"
-        else:
-            # Price increase
-            message += f"Prijsverhoging voor {label}"
-            message += f"\nVan €{old_price:.2f} naar €{new_price:.2f}"
-            
-            price_increase = new_price - old_price
-            percentage_increase = (price_increase / old_price) * 100
-            message += f"\nPrijsstijging: €{price_increase:.2f} ({percentage_increase:.1f}%)"
-        
+    if notification_type != "new_product":
         # Add price history to message
         if lowest_price is not None and highest_price is not None:
-            message += "\n\nPrijsgeschiedenis:"
+            parts.append(_PRICE_HISTORY_HEADER)
             
             # Lowest price
             if lowest_price < new_price:
-                message += f"\nLaagste prijs ooit: €{lowest_price:.2f}"
+                parts.append(_LOWEST_PRICE_TEMPLATE.format(lowest_price))
                 if lowest_price_date:
-                    message += f" op {lowest_price_date.strftime('%d-%m-%Y')}"
+                    parts.append(_PRICE_DATE_TEMPLATE.format(lowest_price_date))
             
             # Highest price
             if highest_price > new_price:
-                message += f"\nHoogste prijs ooit: €{highest_price:.2f}"
+                parts.append(_HIGHEST_PRICE_TEMPLATE.format(highest_price))
                 if highest_price_date:
-                    message += f" op {highest_price_date.strftime('%d-%m-%Y')}"
+                    parts.append(_PRICE_DATE_TEMPLATE.format(highest_price_date))
     
-    # Log notification in database with error handling
-    notification_id = db.save_notification(
+    message = "".join(parts)
+    
+    # Log notification in database with error handling, or collect it for a batched insert
+    notification_row = (
         user_id,
         query_id,
         product_id,
@@ -153,39 +238,16 @@ async def notify_user(app, query_id: int, product_id: int = None, label: str = N
         message,
         chat_id
     )
+    if notification_log is not None:
+        notification_log.append(notification_row)
+        notification_id = None
+    else:
+        notification_id = await asyncio.to_thread(db.save_notification, *notification_row)
     
     try:
-        if image_url:
-            # Als er een afbeelding is, stuur alles in één bericht
-            await app.bot.send_photo(
-                chat_id=chat_id,
-                photo=image_url,
-                caption=message,
-                reply_markup=InlineKeyboardMarkup([
-                    [InlineKeyboardButton(text="Bekijk product", url=product_url)]
-                ])
-            )
-        else:
-            # Als er geen afbeelding is, stuur alleen het bericht met de URL
-            message += f"\n{product_url}"
-            await app.bot.send_message(
-                chat_id=chat_id,
-                text=message,
-                disable_web_page_preview=True
-            )
-        logger.info(f"Notification sent to {chat_id}: {notification_type} for {label} from query '{query_name}'")
-    except Exception as e:
-        logger.error(f"Failed to send notification to {chat_id}: {e}")
-        # Als het bericht met afbeelding mislukt, probeer een fallback zonder afbeelding
-        if image_url:
-            try:
-                message += f"\n{product_url}"
-                await app.bot.send_message(
-                    chat_id=chat_id,
-                    text=message,
-                    disable_web_page_preview=True
-                )
-            except Exception as e:
-                logger.error(f"Failed to send fallback message to {chat_id}: {e}")
+        await _send_product_message(app, chat_id, message, product_url, image_url)
+        logger.info("Notification sent to %s: %s for %s from query '%s'", chat_id, notification_type, label, query_name)
+    except TelegramError as e:
+        logger.error("Failed to send notification to %s: %s", chat_id, e)
         
     return notification_id
\ No newline at end of file
@@ -2,38 +2,71 @@
 Query Processing Module
 Handles all query execution logic, product processing, and database interactions for query results.
 """
+import asyncio
 import logging
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-import importlib
-import re
+from urllib.parse import urlparse
 import database
-from config import TOKEN
 from scrapers.lidl import LidlScraper
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of notifications in flight; the bot's AIORateLimiter enforces the 30 messages per second cap
+MAX_CONCURRENT_NOTIFICATIONS = 25
+_notification_semaphore = asyncio.Semaphore(MAX_CONCURRENT_NOTIFICATIONS)
+
+# Maximum number of queries scraped concurrently per check cycle
+MAX_CONCURRENT_QUERIES = 8
+# Scrapes block on HTTP (including retry sleeps), so they get their own bounded pool
+# instead of the loop's default executor, which the database and notification work share
+_scrape_executor = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_QUERIES, thread_name_prefix="scrape")
+
+# Queries whose requests fail (no response or a non-200 status) are retried with exponential
+# backoff per query, so one broken URL does not hit the shop every check cycle:
+# 1, 2, 4, ... minutes, capped at the query's own interval
+FAILURE_BACKOFF_BASE_SECONDS = 60
+# query_id -> (consecutive failures, earliest next attempt); only holds active queries
+_query_failures = {}
+
+# Scraper instances shared by all queries, keyed by host suffix
+_LIDL_SCRAPER = LidlScraper()
+_DEFAULT_SCRAPER = _LIDL_SCRAPER
+# LidlScraper only knows the Dutch shop (nl_NL parameters, www.lidl.nl product links)
+_SCRAPER_REGISTRY = {
+    "lidl.nl": _LIDL_SCRAPER,
+}
+
 def get_scraper_for_url(url: str):
     """
     Determine which scraper to use based on the URL.
-    This function can be extended to support multiple scrapers.
+    Register additional scrapers in _SCRAPER_REGISTRY to support other shops.
     
     Args:
         url: The URL to determine scraper for
         
     Returns:
-        An instance of the appropriate scraper
+        The scraper instance registered for the URL's host, or the default scraper
     """
-    # Currently only supports Lidl, but can be extended
-    if "lidl" in url:
-        return LidlScraper()
-    else:
-        # Default to Lidl scraper for now
-        # In the future, this could be more sophisticated
-        # or raise an error if no matching scraper is found
-        return LidlScraper()
-
-async def execute_query(query_id: int, query_text: str):
+    host = urlparse(url).netloc.lower()
+    return next(
+        (scraper for suffix, scraper in _SCRAPER_REGISTRY.items()
+         if host == suffix or host.endswith("." + suffix)),
+        _DEFAULT_SCRAPER
+    )
+
+def _start_scrape(scraper, query_text: str) -> asyncio.Future:
+    """
+    Run scraper.execute_paginated_query on the dedicated scrape executor.
+    
+    Returns:
+        A future that can be awaited by every query sharing this scrape
+    """
+    loop = asyncio.get_running_loop()
+    return loop.run_in_executor(_scrape_executor, scraper.execute_paginated_query, query_text)
+
+async def execute_query(query_id: int, query_text: str, scrape_task: asyncio.Future = None):
     """
     Execute a query and process its results.
     Uses the appropriate scraper's paginated query functionality.
@@ -41,23 +74,30 @@ async def execute_query(query_id: int, query_text: str):
     Args:
         query_id: The database ID of the query
         query_text: The query text (URL or API endpoint)
+        scrape_task: Optional shared scrape of query_text, so queries with the same
+            URL are fetched only once per check cycle
     
     Returns:
-        tuple: (success, notifications)
+        tuple: (success, notifications, request_failed); request_failed is True when the
+        shop could not be queried (no response or a non-200 status)
     """
+    # Track execution time (monotonic, nanosecond resolution)
+    start_ns = time.perf_counter_ns()
+    
+    # Determine which scraper to use based on the URL
+    scraper = get_scraper_for_url(query_text)
+    
     try:
-        # Track execution time
-        execution_start_time = time.time()
-        
-        # Determine which scraper to use based on the URL
-        scraper = get_scraper_for_url(query_text)
-        
         # Convert URL to API URL for logging
         api_url = scraper.convert_url_to_api_url(query_text)
         
         # Execute paginated query using the scraper implementation
-        # This encapsulates all the site-specific pagination logic
-        all_products, success, total_products, error_message, response_status = scraper.execute_paginated_query(query_text)
+        # This encapsulates all the site-specific pagination logic. The scraper
+        # blocks on HTTP requests, so run it on the scrape executor to keep the
+        # event loop free for other queries and Telegram updates.
+        if scrape_task is None:
+            scrape_task = _start_scrape(scraper, query_text)
+        all_products, success, total_products, error_message, response_status = await scrape_task
         
         # Process products using database service
         db = database.db_service
@@ -67,17 +107,21 @@ async def execute_query(query_id: int, query_text: str):
         total_price_changes = 0
         all_notifications = []
         
+        # Database werk is ook blokkerend (SQLite), dus eveneens in een worker thread
         if all_products:
-            new_products, price_changes, notifications = db.process_products(query_id, all_products)
+            new_products, price_changes, notifications = await asyncio.to_thread(
+                db.process_products, query_id, all_products
+            )
             total_new_products = new_products
             total_price_changes = price_changes
             all_notifications = notifications
         
         # Calculate total execution time
-        execution_time_ms = int((time.time() - execution_start_time) * 1000)
+        execution_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
         
         # Log the query execution using database service
-        db.log_query_execution_result(
+        await asyncio.to_thread(
+            db.log_query_execution_result,
             query_id,
             api_url,
             success,
@@ -90,19 +134,25 @@ async def execute_query(query_id: int, query_text: str):
         )
         
         # Return result and notifications for sending
-        logger.info(f"Query {query_id} completed, found {total_products} total products. New: {total_new_products}, Price changes: {total_price_changes}")
-        return success, all_notifications
+        logger.info("Query %s completed, found %s total products. New: %s, Price changes: %s",
+                    query_id, total_products, total_new_products, total_price_changes)
+        request_failed = not success and error_message is not None and response_status != 200
+        return success, all_notifications, request_failed
         
     except Exception as e:
-        logger.exception(f"Error executing query {query_id}: {e}")
+        logger.exception("Error executing query %s: %s", query_id, e)
         
         # Log the failed query
-        execution_time_ms = int((time.time() - execution_start_time) * 1000) if 'execution_start_time' in locals() else 0
-        api_url = scraper.convert_url_to_api_url(query_text) if 'scraper' in locals() else query_text
+        execution_time_ms = (time.perf_counter_ns() - start_ns) // 1_000_000
+        try:
+            api_url = scraper.convert_url_to_api_url(query_text)
+        except Exception:
+            api_url = query_text
         
         # Use database service to log the error
         db = database.db_service
-        db.log_query_execution_result(
+        await asyncio.to_thread(
+            db.log_query_execution_result,
             query_id,
             api_url,
             False,
@@ -114,7 +164,7 @@ async def execute_query(query_id: int, query_text: str):
             execution_time_ms
         )
         
-        return False, []
+        return False, [], False
 
 def convert_url_to_api(url):
     """
@@ -133,58 +183,118 @@ def convert_url_to_api(url):
 # Alias for backwards compatibility
 convert_lidl_url_to_api = convert_url_to_api
 
+async def _send_notification(app, notification: dict, notification_log: list):
+    """Send a single notification while holding the shared notification semaphore."""
+    from modules.notification import notify_user
+    async with _notification_semaphore:
+        return await notify_user(app=app, notification_log=notification_log, **notification)
+
 async def check_queries(app):
     """
     Periodically check for queries that need to be executed.
     
     Args:
         app: The Telegram application instance for sending notifications
+    
+    Returns:
+        float: Seconds until the next query becomes due, or None if there are no active queries
     """
-    from modules.notification import notify_user
     logger.info("Checking queries for execution...")
     
     # Gebruik database service voor database operaties
     db = database.db_service
     
     # Haal actieve queries op
-    queries = db.get_active_queries()
+    queries = await asyncio.to_thread(db.get_active_queries)
+    
+    # Vergeet de backoff van queries die verwijderd of gepauzeerd zijn
+    active_query_ids = {query[0] for query in queries}
+    for query_id in _query_failures.keys() - active_query_ids:
+        del _query_failures[query_id]
 
+    # Bepaal eerst welke queries aan de beurt zijn, en wanneer de volgende query weer aan de beurt is
+    # Eén tijdstip voor de hele cyclus, zodat alle queries tegen dezelfde klok worden vergeleken
+    now = datetime.now()
+    due_queries = []
+    next_due_seconds = None
     for query_id, query_text, interval_minutes, last_run_str in queries:
         if last_run_str:
             last_run = datetime.fromisoformat(last_run_str)
         else:
             last_run = None
 
-        now = datetime.now()
-        if last_run is None or now - last_run >= timedelta(minutes=interval_minutes):
-            logger.info(f"Executing query {query_id}...")
+        interval = timedelta(minutes=interval_minutes)
+        failure = _query_failures.get(query_id)
+        if failure is not None and now < failure[1]:
+            logger.info("Skipping query %s, backing off after %d failures until %s", query_id, failure[0], failure[1])
+            due_in = (failure[1] - now).total_seconds()
+        elif last_run is None or now - last_run >= interval:
+            due_queries.append((query_id, query_text, interval))
+            # Na deze run is de query pas over een volledig interval weer aan de beurt
+            due_in = interval.total_seconds()
+        else:
+            logger.info("Skipping query %s, last run was %s", query_id, last_run)
+            due_in = (last_run + interval - now).total_seconds()
+        
+        if next_due_seconds is None or due_in < next_due_seconds:
+            next_due_seconds = due_in
+
+    # Voer de queries gelijktijdig uit, begrensd door een semaphore
+    query_semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    # Queries met dezelfde URL (bijv. van verschillende gebruikers) delen één scrape per cyclus
+    scrape_tasks = {}
+
+    async def _run_one(query_id: int, query_text: str, interval: timedelta):
+        async with query_semaphore:
+            logger.info("Executing query %s...", query_id)
+            
+            scrape_task = scrape_tasks.get(query_text)
+            if scrape_task is None:
+                scrape_task = _start_scrape(get_scraper_for_url(query_text), query_text)
+                scrape_tasks[query_text] = scrape_task
+            else:
+                logger.info("Query %s reuses the results of an identical query in this cycle", query_id)
             
-            # Execute the query (geen database verbinding meer nodig)
-            success, notifications = await execute_query(query_id, query_text)
+            # Execute the query (scraper en database werk draaien in worker threads)
+            success, notifications, request_failed = await execute_query(query_id, query_text, scrape_task)
             
             # Update last_run only if query executed successfully
             if success:
-                db.update_query_last_run(query_id, now.isoformat())
-                logger.info(f"Query {query_id} executed successfully, last_run updated")
-                
-                # Process notifications
-                for notification in notifications:
-                    await notify_user(
-                        app=app,
-                        query_id=notification['query_id'],
-                        product_id=notification['product_id'],
-                        label=notification['label'],
-                        new_price=notification['new_price'],
-                        old_price=notification['old_price'],
-                        product_url=notification['product_url'],
-                        image_url=notification['image_url'],
-                        notification_type=notification['notification_type'],
-                        discount_amount=notification['discount_amount'],
-                        discount_percentage=notification['discount_percentage']
-                    )
+                _query_failures.pop(query_id, None)
+                await asyncio.to_thread(db.update_query_last_run, query_id, now.isoformat())
+                logger.info("Query %s executed successfully, last_run updated", query_id)
+            elif request_failed:
+                failures = _query_failures.get(query_id, (0, None))[0] + 1
+                max_backoff = max(interval.total_seconds(), FAILURE_BACKOFF_BASE_SECONDS)
+                backoff = min(FAILURE_BACKOFF_BASE_SECONDS * 2 ** (failures - 1), max_backoff)
+                _query_failures[query_id] = (failures, datetime.now() + timedelta(seconds=backoff))
+                logger.warning("Query %s failed (%dx), last_run not updated, retrying in %ss", query_id, failures, backoff)
             else:
-                logger.warning(f"Query {query_id} failed, last_run not updated")
-        else:
-            logger.info(f"Skipping query {query_id}, last run was {last_run}")
+                logger.warning("Query %s returned no products, last_run not updated", query_id)
+        
+        if success:
+            # Send notifications concurrently; a failed notification must not abort the others
+            notification_log = []
+            results = await asyncio.gather(
+                *(_send_notification(app, notification, notification_log) for notification in notifications),
+                return_exceptions=True
+            )
+            for notification, result in zip(notifications, results):
+                if isinstance(result, Exception):
+                    logger.error("Notification for product %s of query %s failed: %s",
+                                 notification['product_id'], query_id, result)
+            
+            # Sla alle notificaties van deze query in één transactie op
+            if notification_log:
+                await asyncio.to_thread(db.save_notifications, notification_log)
+
+    results = await asyncio.gather(
+        *(_run_one(query_id, query_text, interval) for query_id, query_text, interval in due_queries),
+        return_exceptions=True
+    )
+    for (query_id, _, _), result in zip(due_queries, results):
+        if isinstance(result, Exception):
+            logger.error("Query %s raised an unexpected error: %s", query_id, result)
 
-    logger.info("Query check complete.")
\ No newline at end of file
+    logger.info("Query check complete.")
+    return next_due_seconds
@@ -4,12 +4,15 @@ Handles scheduling and executing periodic tasks.
 """
 import asyncio
 import logging
-from datetime import datetime, timedelta
-from config import TOKEN
 from modules.query_processor import check_queries
 
 logger = logging.getLogger(__name__)
 
+# Maximale wachttijd tussen twee controles, zodat nieuwe of gewijzigde queries snel worden opgepakt
+MAX_CHECK_INTERVAL_SECONDS = 60
+# Minimale wachttijd, om bij direct weer verlopen queries niet continu te controleren
+MIN_CHECK_INTERVAL_SECONDS = 1
+
 class TaskScheduler:
     """
     Manages scheduled tasks like checking for queries to run.
@@ -76,18 +79,22 @@ class TaskScheduler:
         """Run the scheduler loop to check for and execute queries."""
         try:
             while self.is_running:
+                next_due_seconds = None
                 try:
-                    await check_queries(self.app)
+                    next_due_seconds = await check_queries(self.app)
                 except Exception as e:
                     logger.exception(f"Error in check_queries: {e}")
-                    
-                # Sleep but be responsive to cancellation
+                
+                # Slaap tot de volgende query aan de beurt is (maximaal een minuut),
+                # maar word direct wakker wanneer de scheduler gestopt wordt
+                if next_due_seconds is None:
+                    timeout = MAX_CHECK_INTERVAL_SECONDS
+                else:
+                    timeout = min(max(next_due_seconds, MIN_CHECK_INTERVAL_SECONDS), MAX_CHECK_INTERVAL_SECONDS)
                 try:
-                    # Use a simple sleep rather than waiting on the event
-                    for _ in range(6):  # Check every 60 seconds (10 seconds * 6)
-                        if not self.is_running:
-                            break
-                        await asyncio.sleep(10)
+                    await asyncio.wait_for(self._stopped.wait(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    pass
                 except asyncio.CancelledError:
                     logger.info("Sleep was cancelled")
                     break
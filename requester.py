@@ -1,50 +1,92 @@
 import requests
 import logging
 import ua_generator
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__name__)
 
+# Langste wachttijd die een Retry-After header mag afdwingen; de scrape thread blijft anders te lang bezet
+MAX_RETRY_AFTER_SECONDS = 30
+
+class _CappedRetry(Retry):
+    """Retry die de door de server gevraagde Retry-After wachttijd begrenst."""
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER_SECONDS)
+
 class LidlRequester:
-    def __init__(self, max_retries=3):
+    def __init__(self, max_retries=3, pool_maxsize=32, timeout=10, connect_timeout=3):
         self.max_retries = max_retries
+        # Aparte connect- en read-timeout: een onbereikbare host faalt snel
+        self.timeout = (connect_timeout, timeout)
+        # Eén sessie per requester, zodat TCP/TLS-verbindingen hergebruikt worden (keep-alive)
         self.session = requests.Session()
-        self.last_response = None
+        self.session.headers.update({"Connection": "keep-alive"})
+        # Verbindingsfouten, rate limits en tijdelijke serverfouten worden alleen hier,
+        # op verbindingsniveau, met backoff opnieuw geprobeerd (max_retries pogingen in totaal),
+        # met respect voor Retry-After (begrensd tot MAX_RETRY_AFTER_SECONDS)
+        retry = _CappedRetry(
+            total=max_retries - 1,
+            backoff_factor=0.3,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=frozenset({"GET"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
         self.set_user_agent()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Sluit de sessie en alle open verbindingen."""
+        self.session.close()
+
     def set_user_agent(self):
-        """Genereer en zet een nieuwe User-Agent."""
+        """Genereer en zet een nieuwe standaard User-Agent op de sessie."""
         ua = str(ua_generator.generate())
         self.session.headers.update({"User-Agent": ua})
         logger.info(f"Generated User-Agent: {ua}")
 
+    @staticmethod
+    def _request_headers():
+        """
+        Headers met een nieuwe User-Agent voor één request.
+        De sessie-headers worden gedeeld door parallelle threads en worden dus niet aangepast.
+        """
+        return {"User-Agent": str(ua_generator.generate())}
+
     def get(self, url, params=None):
-        """Voer een GET-request uit met herhaalde pogingen."""
-        for attempt in range(self.max_retries):
-            self.set_user_agent()
-            try:
-                response = self.session.get(url, params=params)
-                # Bewaar laatste response voor foutanalyse
-                self.last_response = response
-                
-                if response.status_code == 200:
-                    return response
-                logger.warning(
-                    f"GET {url} attempt {attempt+1}/{self.max_retries} failed: {response.status_code}"
-                )
-            except requests.RequestException as e:
-                logger.error(f"GET {url} attempt {attempt+1}/{self.max_retries} error: {e}")
-                self.last_response = None
-        logger.error(f"Max retries ({self.max_retries}) reached for GET {url}")
+        """
+        Voer een GET-request uit; herhaalde pogingen doet de Retry van de adapter.
+        
+        Geeft de laatste response terug, ook bij een foutstatus, zodat de aanroeper de
+        status per request heeft. None als er geen response was. De requester wordt
+        gedeeld door gelijktijdige scrapes en houdt daarom geen status per request bij.
+        """
+        try:
+            response = self.session.get(url, params=params, headers=self._request_headers(), timeout=self.timeout)
+            if response.status_code != 200:
+                logger.warning(f"GET {url} failed: {response.status_code}")
+            return response
+        except requests.RequestException as e:
+            logger.error(f"GET {url} error: {e}")
         return None
 
     def post(self, url, data=None):
         """Voer een POST-request uit."""
-        self.set_user_agent()
         try:
-            response = self.session.post(url, data=data)
-            # Bewaar laatste response voor foutanalyse
-            self.last_response = response
-            
+            response = self.session.post(url, data=data, headers=self._request_headers(), timeout=self.timeout)
             response.raise_for_status()
             return response
         except requests.RequestException as e:
@@ -2,13 +2,16 @@
 Basis klassen voor scrapers - deze definieert de interface die elke scraper moet implementeren.
 """
 from abc import ABC, abstractmethod
-from dataclasses import dataclass
-from typing import List, Dict, Any, Optional, Union, Tuple
+from dataclasses import dataclass, field
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ProductInfo:
-    """Generieke productinformatie, onafhankelijk van de bron."""
+    """
+    Generieke productinformatie, onafhankelijk van de bron.
+    Instanties zijn onveranderlijk en gebruiken __slots__ (geen __dict__ per product).
+    """
     id: str
     name: str
     price: float
@@ -18,24 +21,29 @@ class ProductInfo:
     discount_amount: Optional[float] = None
     discount_percentage: Optional[float] = None
     recommended_price: Optional[float] = None
-    additional_info: Dict[str, Any] = None
+    # Standaard None; wordt niet meegenomen in de hash omdat een dict niet hashbaar is
+    additional_info: Optional[Dict[str, Any]] = field(default=None, hash=False)
 
 
 class BaseScraper(ABC):
     """Basis klasse voor alle scrapers."""
     
+    def close(self) -> None:
+        """Geeft resources zoals HTTP sessies vrij. Standaard is er niets te sluiten."""
+        pass
+    
     @abstractmethod
     def convert_url_to_api_url(self, url: str) -> str:
         """Converteert een normale productpagina URL naar een API URL."""
         pass
     
     @abstractmethod
-    def extract_products_from_response(self, response_data: Any) -> List[ProductInfo]:
-        """Extraheert productinformatie uit de API response."""
+    def extract_products_from_response(self, response_data: Any) -> Iterator[ProductInfo]:
+        """Extraheert productinformatie uit de API response (als generator)."""
         pass
     
     @abstractmethod
-    def get_products(self, url: str, params: Dict[str, Any] = None) -> List[ProductInfo]:
+    def get_products(self, url: str, params: Optional[Dict[str, Any]] = None) -> List[ProductInfo]:
         """Haalt producten op van de API en verwerkt ze tot ProductInfo objecten."""
         pass
     
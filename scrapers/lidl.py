@@ -2,63 +2,150 @@
 Lidl-specifieke scraper implementatie.
 """
 import re
-import json
-from typing import List, Dict, Any, Optional, Tuple
+from typing import List, Dict, Any, Optional, Tuple, Iterator
 import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+import orjson
 
 from scrapers.base import BaseScraper, ProductInfo
 from requester import LidlRequester
 
 logger = logging.getLogger(__name__)
 
+# Voorgecompileerde patronen voor URL-bewerkingen
+_RE_OFFSET = re.compile(r"offset=\d+")
+_RE_FETCHSIZE = re.compile(r"fetchsize=\d+")
+_RE_FETCHSIZE_VAL = re.compile(r"fetchsize=(\d+)")
+
+# Query parameters die de Lidl API verwacht, met hun standaardwaarden
+_DEFAULT_PARAMS = {
+    "fetchsize": "48",
+    "locale": "nl_NL",
+    "assortment": "NL",
+    "version": "2.1.0",
+    "idsOnly": "false",
+    "productsOnly": "true",
+}
+_REQUIRED_KEYS = frozenset(_DEFAULT_PARAMS)
+_RE_PARAMS = re.compile(r"[?&](" + "|".join(_DEFAULT_PARAMS) + r")=")
+_DEFAULT_QUERY = urlencode(_DEFAULT_PARAMS)
+
+
+@lru_cache(maxsize=512)
+def _convert_url_to_api_cached(url: str) -> str:
+    """
+    Converteert een gewone Lidl URL naar een API URL.
+    De omzetting is puur, dus het resultaat wordt per URL gecachet.
+    """
+    # Snelle route: een URL die al een volledige API URL is hoeft niet geparsed te worden
+    if "/q/api/" in url and not _REQUIRED_KEYS.difference(_RE_PARAMS.findall(url)):
+        return url
+    
+    parts = urlsplit(url)
+    path = parts.path
+    
+    # Voeg 'q/api/' toe aan het pad als de URL nog geen API URL is
+    if parts.netloc == "www.lidl.nl" and "/q/api/" not in path:
+        if path.startswith("/q/"):
+            path = path.replace("/q/", "/q/api/", 1)
+        elif path.startswith("/"):
+            path = "/q/api" + path
+    
+    if parts.query:
+        # Vul ontbrekende query parameters aan met de standaardwaarden
+        params = parse_qsl(parts.query, keep_blank_values=True)
+        missing = _REQUIRED_KEYS.difference(key for key, _ in params)
+        if missing:
+            params.extend((key, value) for key, value in _DEFAULT_PARAMS.items() if key in missing)
+            query = urlencode(params)
+        else:
+            query = parts.query
+    else:
+        # Geen parameters, gebruik de vooraf opgebouwde standaard query
+        query = _DEFAULT_QUERY
+    
+    api_url = urlunsplit((parts.scheme, parts.netloc, path, query, parts.fragment))
+    
+    # Log de omgezette URL voor debug doeleinden
+    logger.debug("Converted URL: %s -> %s", url, api_url)
+    
+    return api_url
+
+
+@lru_cache(maxsize=512)
+def _fetch_size_from_url(url: str) -> Optional[int]:
+    """Haal de fetchsize uit een URL, of None als die ontbreekt."""
+    fetch_match = _RE_FETCHSIZE_VAL.search(url)
+    if fetch_match:
+        return int(fetch_match.group(1))
+    return None
+
+
+def _extract_total(response_data: Any) -> Optional[int]:
+    """Haal het totaal aantal resultaten uit de API response, indien aanwezig."""
+    if not isinstance(response_data, dict):
+        return None
+    total = response_data.get('numFound')
+    if total is None:
+        total = response_data.get('total')
+    if total is None and isinstance(response_data.get('results'), dict):
+        total = response_data['results'].get('total')
+    return total if isinstance(total, int) else None
+
+
+def _extract_price(price_data: Optional[Dict[str, Any]]) -> Tuple[Optional[float], Optional[float], Optional[float], Optional[float], Optional[float]]:
+    """
+    Haal de prijsinformatie uit een price-object van de API.
+    
+    Returns:
+        Tuple met (price, old_price, recommended_price, discount_amount, discount_percentage)
+    """
+    if price_data is None:
+        return None, None, None, None, None
+    
+    price = price_data.get('price', 0.0)
+    old_price = price_data.get('oldPrice', None)
+    recommended_price = None
+    discount_amount = None
+    discount_percentage = None
+    
+    # De oldPrice gebruiken als recommended_price
+    if old_price and old_price > 0:
+        recommended_price = old_price
+        
+        # Bereken de korting als er een oude prijs is die hoger is dan de huidige prijs
+        if price < old_price:
+            discount_amount = old_price - price
+            discount_percentage = (discount_amount / old_price) * 100
+    
+    return price, old_price, recommended_price, discount_amount, discount_percentage
+
 
 class LidlScraper(BaseScraper):
     """Scraper voor Lidl-producten."""
     
-    def __init__(self):
+    def __init__(self) -> None:
         """Initialiseer de Lidl scraper."""
-        self.requester = LidlRequester()
         self.default_fetch_size = 48
+        # Aantal pagina's dat tegelijk wordt opgehaald bij grote zoekopdrachten
+        self.max_parallel_pages = 4
+        # De scraper wordt gedeeld door gelijktijdig uitgevoerde queries, dus de
+        # standaard connection pool van de requester is ruim bemeten
+        self.requester = LidlRequester()
+    
+    def close(self) -> None:
+        """Sluit de onderliggende HTTP sessie."""
+        self.requester.close()
     
     def convert_url_to_api(self, url: str) -> str:
         """
         Converteert een gewone Lidl URL naar een API URL.
         """
-        # Controleer of de URL al "api" bevat om dubbele api te voorkomen
-        if "/q/api/" in url:
-            api_url = url  # URL bevat al 'api', niet opnieuw toevoegen
-        else:
-            # Voeg 'api/' toe na 'q/' als dat nog niet gedaan is
-            api_url = re.sub(r"www\.lidl\.nl/q/", "www.lidl.nl/q/api/", url)
-            
-            # Als de structuur anders is, controleer of we nog geen 'q/api/' hebben
-            if "/q/api/" not in api_url:
-                # Voeg 'q/api/' toe na de domeinnaam
-                api_url = re.sub(r"www\.lidl\.nl/", "www.lidl.nl/q/api/", url)
-        
-        # Controleer of de URL al query parameters heeft
-        if '?' in api_url:
-            # Parameters zijn al aanwezig, voeg ontbrekende toe
-            if "fetchsize=" not in api_url:
-                api_url += "&fetchsize=48"
-            if "locale=" not in api_url:
-                api_url += "&locale=nl_NL"
-            if "assortment=" not in api_url:
-                api_url += "&assortment=NL"
-            if "version=" not in api_url:
-                api_url += "&version=2.1.0"
-            if "idsOnly=" not in api_url:
-                api_url += "&idsOnly=false"
-            if "productsOnly=" not in api_url:
-                api_url += "&productsOnly=true"
-        else:
-            # Geen parameters, voeg ze toe
-            api_url += "?fetchsize=48&locale=nl_NL&assortment=NL&version=2.1.0&idsOnly=false&productsOnly=true"
-        
-        # Log de omgezette URL voor debug doeleinden
-        logger.debug(f"Converted URL: {url} -> {api_url}")
-        
-        return api_url
+        return _convert_url_to_api_cached(url)
     
     # Alias voor backwards compatibility
     convert_url_to_api_url = convert_url_to_api
@@ -73,9 +160,9 @@ class LidlScraper(BaseScraper):
         Returns:
             int: De fetchsize waarde
         """
-        fetch_match = re.search(r"fetchsize=(\d+)", url)
-        if fetch_match:
-            return int(fetch_match.group(1))
+        fetch_size = _fetch_size_from_url(url)
+        if fetch_size is not None:
+            return fetch_size
         return self.default_fetch_size
     
     def execute_paginated_query(self, url: str) -> Tuple[List[ProductInfo], bool, int, Optional[str], Optional[int]]:
@@ -96,157 +183,168 @@ class LidlScraper(BaseScraper):
         api_url = self.convert_url_to_api(url)
         fetch_size = self.get_fetch_size(api_url)
         
-        offset = 0
-        more_results = True
         all_products = []
         success = False
         error_message = None
         response_status = None
         
-        while more_results:
-            # Parameters voor deze pagina
-            current_api_url = api_url
-            
-            # Pas offset parameter toe
-            if "offset=" in current_api_url:
-                current_api_url = re.sub(r"offset=\d+", f"offset={offset}", current_api_url)
-            else:
-                separator = '&' if '?' in current_api_url else '?'
-                current_api_url += f"{separator}offset={offset}"
-            
-            logger.info(f"Querying with offset {offset}: {current_api_url}")
-            
-            # Haal producten op
-            products = self.get_products(current_api_url)
-            
-            if products is None or len(products) == 0:
-                # Als products None is, ging er iets mis
-                logger.error(f"Failed to get products for URL {current_api_url}")
-                
-                if self.requester.last_response:
-                    response_status = self.requester.last_response.status_code
-                    error_message = f"Status code: {response_status}"
-                else:
-                    error_message = "No response received"
+        # Parse de URL één keer; per pagina wordt alleen de offset-waarde vervangen
+        parts = urlsplit(api_url)
+        params = parse_qsl(parts.query, keep_blank_values=True)
+        offset_index = next((i for i, (key, _) in enumerate(params) if key == "offset"), len(params))
+        if offset_index == len(params):
+            params.append(("offset", "0"))
+        
+        def page_url(page_offset: int) -> str:
+            params[offset_index] = ("offset", str(page_offset))
+            return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(params), ""))
+        
+        # De eerste pagina wordt altijd los opgehaald; de meeste queries passen op één pagina
+        # en dan worden er geen speculatieve requests verstuurd
+        offset = 0
+        products, total, status = self._fetch_page(page_url(offset), offset)
+        next_offset = offset + fetch_size
+        pending = deque()
+        executor = None
+        
+        try:
+            while True:
+                if not products:
+                    # Een lege pagina betekent dat er iets mis ging of dat er geen resultaten meer zijn
+                    logger.error("Failed to get products for offset %d", offset)
+                    
+                    # De status hoort bij deze pagina; de requester wordt gedeeld door
+                    # parallelle pagina's en gelijktijdige queries
+                    if status is not None:
+                        response_status = status
+                        error_message = f"Status code: {response_status}"
+                    else:
+                        error_message = "No response received"
+                    
+                    break
                 
-                break
-            
-            products_found = len(products)
-            all_products.extend(products)
-            
-            if products_found > 0:
+                all_products.extend(products)
                 success = True  # Als we minstens één product vonden, is de query succesvol
-            
-            # Als we minder producten kregen dan de fetchsize,
-            # zijn er waarschijnlijk geen meer
-            if products_found < fetch_size:
-                more_results = False
-            else:
-                # Verhoog offset voor de volgende pagina
-                offset += fetch_size
+                
+                # Als we minder producten kregen dan de fetchsize,
+                # zijn er waarschijnlijk geen meer
+                if len(products) < fetch_size:
+                    break
+                
+                # Houd een venster van pagina's tegelijk in behandeling. Als de API het totaal
+                # aantal resultaten meegeeft, worden alleen de benodigde pagina's opgevraagd.
+                while len(pending) < self.max_parallel_pages and (total is None or next_offset < total):
+                    if executor is None:
+                        executor = ThreadPoolExecutor(max_workers=self.max_parallel_pages)
+                    pending.append((next_offset, executor.submit(self._fetch_page, page_url(next_offset), next_offset)))
+                    next_offset += fetch_size
+                
+                if not pending:
+                    # Alle pagina's volgens het opgegeven totaal zijn binnen
+                    break
+                
+                offset, future = pending.popleft()
+                products, _, status = future.result()
+        finally:
+            if executor is not None:
+                # Openstaande speculatieve pagina's zijn niet meer nodig
+                for _, future in pending:
+                    future.cancel()
+                executor.shutdown(wait=True)
         
         return all_products, success, len(all_products), error_message, response_status
     
-    def extract_products_from_response(self, response_data: Dict[str, Any]) -> List[ProductInfo]:
+    def _fetch_page(self, page_url: str, offset: int) -> Tuple[List[ProductInfo], Optional[int], Optional[int]]:
         """
-        Extraheert productinformatie uit de Lidl API response.
+        Haalt één pagina met producten op.
+        
+        Args:
+            page_url: De API URL van de pagina, inclusief offset
+            offset: De offset van de pagina (voor logging)
+            
+        Returns:
+            Tuple met de lijst ProductInfo objecten (leeg bij een fout), het totaal
+            aantal resultaten volgens de API (indien bekend) en de HTTP status code
+            (None als er geen response was)
         """
-        products = []
-        items = []
+        logger.info("Querying with offset %d: %s", offset, page_url)
         
+        return self._request_products(page_url)
+    
+    def extract_products_from_response(self, response_data: Dict[str, Any]) -> Iterator[ProductInfo]:
+        """
+        Extraheert productinformatie uit de Lidl API response.
+        Producten worden één voor één opgeleverd, zodat er geen tussenlijst nodig is.
+        """
         # Bepaal waar de items zitten in de JSON structuur
         if isinstance(response_data, dict):
-            # Zoek naar de producten in de response
-            if "items" in response_data:
-                items = response_data["items"]
-            elif "products" in response_data:
-                items = response_data["products"]
-            elif "results" in response_data and "products" in response_data["results"]:
-                items = response_data["results"]["products"]
+            # Zoek naar de producten in de response; "results" is niet altijd een dict
+            results = response_data.get("results")
+            items = (
+                response_data.get("items")
+                or response_data.get("products")
+                or (results.get("products") if isinstance(results, dict) else None)
+                or []
+            )
         elif isinstance(response_data, list):
             # De response is al een lijst producten
             items = response_data
-            
+        else:
+            items = []
+        
         for item in items:
             product = self._parse_product_item(item)
             if product:
-                products.append(product)
-                
-        return products
+                yield product
     
     def _parse_product_item(self, item: Dict[str, Any]) -> Optional[ProductInfo]:
         """
         Verwerkt een enkel product-item uit de API response.
         """
+        if not isinstance(item, dict):
+            logger.warning("Skipping product item of unexpected type %s", type(item).__name__)
+            return None
+        
+        # Basisgegevens
+        product_id = item.get('code', item.get('id', 'N/A'))
+        name = item.get('label', item.get('name', 'N/A'))
+        
+        # Gridbox data één keer opzoeken; ontbrekende niveaus worden een lege dict
+        gridbox = item.get('gridbox')
+        grid_data = gridbox.get('data') if isinstance(gridbox, dict) else None
+        if not isinstance(grid_data, dict):
+            grid_data = {}
+        
+        # Prijsinformatie: probeer gridbox structuur, met fallback naar oudere structuur
+        if 'price' in grid_data:
+            price_data = grid_data['price']
+        else:
+            price_data = item.get('price')
+        
+        # Afbeelding URL
+        image_url = item.get('mouseoverImage')
+        if not image_url:
+            # Probeer beeld uit gridbox te halen
+            image_url = grid_data.get('image')
+        
+        # Product URL
+        canonical_path = item.get('canonicalUrl')
+        # Als canonicalUrl niet bestaat, probeer uit gridbox te halen
+        if not canonical_path:
+            canonical_path = grid_data.get('canonicalPath')
+        
+        # Extra informatie die specifiek is voor Lidl
+        brand = grid_data.get('brand')
+        additional_info = {
+            'brand': brand.get('name') if isinstance(brand, dict) else None,
+            'fullTitle': grid_data.get('fullTitle'),
+            'category': grid_data.get('category')
+        }
+        
+        # Alleen de berekeningen op API-waarden kunnen nog falen bij een afwijkend item
         try:
-            # Basisgegevens
-            product_id = item.get('code', item.get('id', 'N/A'))
-            name = item.get('label', item.get('name', 'N/A'))
-            
-            # Prijsinformatie
-            price = None
-            old_price = None
-            recommended_price = None
-            discount_amount = None
-            discount_percentage = None
-            
-            # Probeer gridbox structuur voor prijsinfo
-            if 'gridbox' in item and 'data' in item['gridbox'] and 'price' in item['gridbox']['data']:
-                price_data = item['gridbox']['data']['price']
-                price = price_data.get('price', 0.0)
-                old_price = price_data.get('oldPrice', None)
-                
-                # De oldPrice gebruiken als recommended_price
-                if old_price and old_price > 0:
-                    recommended_price = old_price
-                    
-                    # Bereken de korting als er een oude prijs is die hoger is dan de huidige prijs
-                    if price < old_price:
-                        discount_amount = old_price - price
-                        discount_percentage = (discount_amount / old_price) * 100
-            
-            # Fallback naar oudere structuur
-            elif 'price' in item:
-                price = item['price'].get('price', 0.0)
-                old_price = item['price'].get('oldPrice', None)
-                
-                # De oldPrice gebruiken als recommended_price
-                if old_price and old_price > 0:
-                    recommended_price = old_price
-                    
-                    # Bereken de korting als er een oude prijs is die hoger is dan de huidige prijs
-                    if price < old_price:
-                        discount_amount = old_price - price
-                        discount_percentage = (discount_amount / old_price) * 100
-            
-            # Afbeelding URL
-            image_url = item.get('mouseoverImage', 'N/A')
-            if not image_url or image_url == 'N/A':
-                # Probeer beeld uit gridbox te halen
-                if 'gridbox' in item and 'data' in item['gridbox']:
-                    image_url = item['gridbox']['data'].get('image', 'N/A')
-            
-            # Product URL
-            product_url = f"https://www.lidl.nl{item.get('canonicalUrl', 'N/A')}"
-            # Als canonicalUrl niet bestaat, probeer uit gridbox te halen
-            if product_url.endswith('N/A') and 'gridbox' in item and 'data' in item['gridbox']:
-                canonical_path = item['gridbox']['data'].get('canonicalPath', '')
-                if canonical_path:
-                    product_url = f"https://www.lidl.nl{canonical_path}"
-            
-            # Extra informatie die specifiek is voor Lidl
-            additional_info = {
-                'brand': None,
-                'fullTitle': None,
-                'category': None
-            }
-            
-            if 'gridbox' in item and 'data' in item['gridbox']:
-                grid_data = item['gridbox']['data']
-                if 'brand' in grid_data:
-                    additional_info['brand'] = grid_data['brand'].get('name')
-                additional_info['fullTitle'] = grid_data.get('fullTitle')
-                additional_info['category'] = grid_data.get('category')
+            price, old_price, recommended_price, discount_amount, discount_percentage = _extract_price(price_data)
+            product_url = "https://www.lidl.nl" + canonical_path if canonical_path else ""
             
             # Maak een ProductInfo object
             return ProductInfo(
@@ -254,19 +352,18 @@ class LidlScraper(BaseScraper):
                 name=name,
                 price=price or 0.0,
                 old_price=old_price,
-                image_url=image_url,
+                image_url=image_url or "",
                 product_url=product_url,
                 discount_amount=discount_amount,
                 discount_percentage=discount_percentage,
                 recommended_price=recommended_price,
                 additional_info=additional_info
             )
-        
         except Exception as e:
-            logger.exception(f"Error parsing product item: {e}")
+            logger.exception("Error parsing product item: %s", e)
             return None
     
-    def get_products(self, url: str, params: Dict[str, Any] = None) -> List[ProductInfo]:
+    def get_products(self, url: str, params: Optional[Dict[str, Any]] = None) -> List[ProductInfo]:
         """
         Haalt producten op van Lidl API en verwerkt ze tot ProductInfo objecten.
         
@@ -286,29 +383,48 @@ class LidlScraper(BaseScraper):
         if params:
             for key, value in params.items():
                 if key == 'offset' and 'offset=' in api_url:
-                    api_url = re.sub(r"offset=\d+", f"offset={value}", api_url)
+                    api_url = _RE_OFFSET.sub(f"offset={value}", api_url)
                 elif key == 'offset' and 'offset=' not in api_url:
                     separator = '&' if '?' in api_url else '?'
                     api_url += f"{separator}offset={value}"
                 elif key == 'fetchsize' and 'fetchsize=' in api_url:
-                    api_url = re.sub(r"fetchsize=\d+", f"fetchsize={value}", api_url)
+                    api_url = _RE_FETCHSIZE.sub(f"fetchsize={value}", api_url)
                 elif key == 'fetchsize' and 'fetchsize=' not in api_url:
                     separator = '&' if '?' in api_url else '?'
                     api_url += f"{separator}fetchsize={value}"
         
-        # Maak de request
+        products, _, _ = self._request_products(api_url)
+        return products
+    
+    def _request_products(self, api_url: str) -> Tuple[List[ProductInfo], Optional[int], Optional[int]]:
+        """
+        Voert de API request uit en verwerkt de response.
+        
+        Args:
+            api_url: De volledige API URL
+            
+        Returns:
+            Tuple met de lijst ProductInfo objecten, het totaal aantal resultaten
+            volgens de API (None als de response dat niet vermeldt) en de HTTP
+            status code (None als er geen response was)
+        """
         response = self.requester.get(api_url)
         
-        if not response or response.status_code != 200:
-            logger.error(f"Failed to get data from {api_url}: {response.status_code if response else 'No response'}")
-            return []
+        if response is None:
+            logger.error("Failed to get data from %s: No response", api_url)
+            return [], None, None
+        
+        status = response.status_code
+        if status != 200:
+            logger.error("Failed to get data from %s: %s", api_url, status)
+            return [], None, status
         
         try:
-            data = response.json()
-            return self.extract_products_from_response(data)
-        except json.JSONDecodeError as e:
-            logger.exception(f"Failed to parse JSON: {e}")
-            return []
+            data = orjson.loads(response.content)
+            return list(self.extract_products_from_response(data)), _extract_total(data), status
+        except orjson.JSONDecodeError as e:
+            logger.exception("Failed to parse JSON: %s", e)
+            return [], None, status
         except Exception as e:
-            logger.exception(f"Error getting products: {e}")
-            return []
\ No newline at end of file
+            logger.exception("Error getting products: %s", e)
+            return [], None, status
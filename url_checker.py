@@ -1,39 +1,45 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 import argparse
-import json
 import logging
+import sys
 from typing import Dict, Any
 
+import orjson
+
 from scrapers.lidl import LidlScraper
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-def display_product_info(product, index):
+def format_product_info(product, index):
     """
-    Toont informatie over een product in een geformatteerde manier.
+    Formatteert informatie over een product als tekstblok.
+    De regels worden verzameld en in één keer samengevoegd.
     """
-    print(f"{index}. Product ID: {product.id}")
-    print(f"   Naam: {product.name}")
+    parts = [
+        f"{index}. Product ID: {product.id}",
+        f"   Naam: {product.name}",
+    ]
     
     # Prijs informatie
-    print(f"   Huidige prijs: €{product.price:.2f}" if product.price else "   Huidige prijs: Onbekend")
+    parts.append(f"   Huidige prijs: €{product.price:.2f}" if product.price else "   Huidige prijs: Onbekend")
     
     # Korting informatie
     if product.old_price:
         discount_info = ""
         if product.discount_amount and product.discount_percentage:
             discount_info = f" (Korting: €{product.discount_amount:.2f}, {product.discount_percentage:.1f}%)"
-        print(f"   Oude prijs: €{product.old_price:.2f}{discount_info}")
+        parts.append(f"   Oude prijs: €{product.old_price:.2f}{discount_info}")
     else:
-        print("   Oude prijs: Niet beschikbaar")
+        parts.append("   Oude prijs: Niet beschikbaar")
     
     # Extra informatie
     if product.additional_info and product.additional_info.get('brand'):
-        print(f"   Merk: {product.additional_info['brand']}")
+        parts.append(f"   Merk: {product.additional_info['brand']}")
     
-    print()
+    parts.append("")
+    return "\n".join(parts)
 
 def select_scraper(url):
     """
@@ -55,6 +61,7 @@ def main():
     
     args = parser.parse_args()
     
+    scraper = None
     try:
         # Kies de juiste scraper op basis van de URL
         scraper = select_scraper(args.url)
@@ -85,21 +92,22 @@ def main():
                 print(f"Details voor product {args.detail}:\n")
                 
                 if args.dump:
-                    # Dump alle informatie als JSON
-                    # We moeten het ProductInfo object naar een dict converteren
-                    product_dict = vars(selected_product)
-                    print(json.dumps(product_dict, indent=2, default=str))
+                    # Dump alle informatie als JSON; orjson serialiseert de dataclass rechtstreeks
+                    sys.stdout.write(orjson.dumps(selected_product, option=orjson.OPT_INDENT_2, default=str).decode() + "\n")
                 else:
                     # Toon gedetailleerde productinformatie
-                    display_product_info(selected_product, args.detail)
-                    print(f"Product URL: {selected_product.product_url}")
-                    print(f"Afbeelding: {selected_product.image_url}")
+                    parts = [
+                        format_product_info(selected_product, args.detail),
+                        f"Product URL: {selected_product.product_url}",
+                        f"Afbeelding: {selected_product.image_url}",
+                    ]
                     
                     if selected_product.additional_info:
-                        print("\nExtra informatie:")
+                        parts.append("\nExtra informatie:")
                         for key, value in selected_product.additional_info.items():
                             if value:
-                                print(f"  {key}: {value}")
+                                parts.append(f"  {key}: {value}")
+                    sys.stdout.write("\n".join(parts) + "\n")
             else:
                 print(f"Fout: geen product gevonden met index {args.detail}")
             return
@@ -107,17 +115,19 @@ def main():
         # Anders loop door alle items en toon basisinformatie
         if args.dump:
             # Dump alle producten als JSON
-            products_list = [vars(p) for p in products]
-            print(json.dumps(products_list, indent=2, default=str))
+            sys.stdout.write(orjson.dumps(products, option=orjson.OPT_INDENT_2, default=str).decode() + "\n")
         else:
-            for i, product in enumerate(products):
-                display_product_info(product, i)
+            # Alle producten in één keer wegschrijven in plaats van een print per regel
+            sys.stdout.write("\n".join(format_product_info(product, i) for i, product in enumerate(products)) + "\n")
     
     except ValueError as e:
         print(f"Fout: {e}")
     except Exception as e:
         logger.exception(f"Onverwachte fout: {e}")
         print(f"Er is een fout opgetreden: {e}")
+    finally:
+        if scraper is not None:
+            scraper.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file